@@ -0,0 +1,98 @@
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+
+class Deadline:
+    """
+    Point in time by which a stage of the pipeline should be done. Stages ask how much
+    time is left and degrade (fewer candidates, smaller ensembles) instead of blocking
+    the page. `Deadline(None)` never expires.
+
+    Stages that degrade call `mark_degraded`, which also marks the deadlines this one
+    was portioned from, so callers can tell a cut-short result from a complete one
+    (e.g. to not cache it).
+    """
+
+    def __init__(self, seconds: float | None = None, parent: "Deadline | None" = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+        self.parent = parent
+        self.degraded = False
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return math.inf
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def portion(self, fraction: float) -> "Deadline":
+        """A deadline using only `fraction` of the time that is left."""
+        remaining = self.remaining()
+        return Deadline(None if math.isinf(remaining) else remaining * fraction, parent=self)
+
+    def mark_degraded(self) -> None:
+        deadline: Deadline | None = self
+        while deadline is not None:
+            deadline.degraded = True
+            deadline = deadline.parent
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.1f}s, degraded={self.degraded})"
+
+
+# Shared default: it never expires, and stages never degrade under it.
+NO_DEADLINE = Deadline(None)
+
+
+async def gather_within(
+    aws: Iterable[Awaitable[Any]],
+    deadline: Deadline,
+    min_results: int = 1,
+    usable: Callable[[Any], bool] | None = None,
+    until: Callable[[list[Any]], bool] | None = None,
+) -> list[Any]:
+    """
+    Like asyncio.gather, but once the deadline has passed returns the results that are in
+    (in completion order) and cancels the stragglers, marking the deadline degraded.
+    Waits past the deadline only until `min_results` results, at least one of them
+    `usable` if given, have arrived, since the caller can't do anything with less. Stops
+    waiting early, without degrading, as soon as `until(results)` is true.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    min_results = min(min_results, len(tasks))
+    results: list[Any] = []
+    has_usable = usable is None
+    pending = set(tasks)
+    cut_short = False
+    try:
+        while pending:
+            if until is not None and until(results):
+                break
+            timeout = None
+            if len(results) >= min_results and has_usable:
+                timeout = deadline.remaining()
+                if timeout <= 0:
+                    cut_short = True
+                    break
+                if math.isinf(timeout):
+                    timeout = None
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                cut_short = True
+                break
+            for task in done:
+                result = task.result()
+                results.append(result)
+                has_usable = has_usable or usable(result)
+    finally:
+        for task in pending:
+            task.cancel()
+    if cut_short:
+        print(f"Deadline reached, dropped {len(pending)}/{len(tasks)} pending results")
+        deadline.mark_degraded()
+    return results
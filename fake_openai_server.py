@@ -0,0 +1,263 @@
+"""
+Local stand-in for the parts of the OpenAI ChatCompletion API this app uses (streaming,
+non-streaming and function calls), for load-testing without network access.
+
+Run it with e.g.
+
+    python fake_openai_server.py --port 8000 --latency lognormal:1.5,0.6 --rate-limit-rate 0.1
+
+and point the app at it with `OPENAI_API_BASE=http://127.0.0.1:8000/v1` (any API key works).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler())
+
+WORDS = (
+    "the students read about baseball uniforms and how teams changed them over time "
+    "because players needed to see who was on their team during a game at the park"
+).split()
+
+
+@dataclass
+class LatencyProfile:
+    """Seconds to wait before answering, drawn from `distribution` with `params`."""
+
+    distribution: str = "fixed"
+    params: list[float] = field(default_factory=lambda: [0.0])
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyProfile":
+        # "fixed:1", "uniform:0.5,2", "normal:1,0.2", "lognormal:1.5,0.6", "exponential:2"
+        distribution, _, raw_params = spec.partition(":")
+        params = [float(p) for p in raw_params.split(",") if p]
+        return cls(distribution, params or [0.0])
+
+    def sample(self) -> float:
+        p = self.params
+        if self.distribution == "fixed":
+            value = p[0]
+        elif self.distribution == "uniform":
+            value = random.uniform(p[0], p[1])
+        elif self.distribution == "normal":
+            value = random.gauss(p[0], p[1])
+        elif self.distribution == "lognormal":
+            # Parameterised by the median and the sigma of the underlying normal.
+            value = p[0] * random.lognormvariate(0, p[1])
+        elif self.distribution == "exponential":
+            value = random.expovariate(1 / p[0])
+        else:
+            raise ValueError(f"Unknown latency distribution: {self.distribution}")
+        return max(0.0, value)
+
+
+@dataclass
+class ServerConfig:
+    latency: LatencyProfile = field(default_factory=LatencyProfile)
+    # Delay between streamed chunks.
+    chunk_latency: LatencyProfile = field(default_factory=LatencyProfile)
+    rate_limit_rate: float = 0.0
+    overload_rate: float = 0.0
+    malformed_json_rate: float = 0.0
+    retry_after: float = 1.0
+
+
+def fake_text(n_words: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def fake_value(schema: dict) -> object:
+    """Generates a value that validates against the (simple) JSON schema `schema`."""
+    schema_type = schema.get("type", "string")
+    if isinstance(schema_type, list):
+        schema_type = schema_type[0]
+    if "enum" in schema:
+        return random.choice(schema["enum"])
+    if schema_type == "object":
+        return {
+            name: fake_value(property_schema)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+    if schema_type == "array":
+        n_items = schema.get("minItems", random.randint(1, 5))
+        return [fake_value(schema.get("items", {})) for _ in range(n_items)]
+    if schema_type == "number":
+        return random.randint(1, 5)
+    if schema_type == "integer":
+        return random.randint(1, 5)
+    if schema_type == "boolean":
+        return random.choice([True, False])
+    if schema_type == "null":
+        return None
+    # Multi-paragraph strings exercise the newline escaping on the client side.
+    return "\n\n".join(fake_text(random.randint(8, 25)) for _ in range(random.randint(1, 3)))
+
+
+def malform(arguments: str) -> str:
+    """Reproduces the kinds of broken json the real models emit."""
+    kind = random.choice(["raw_newlines", "truncated", "quoted_number"])
+    if kind == "raw_newlines":
+        return arguments.replace("\\n", "\n")
+    if kind == "truncated":
+        return arguments[: random.randint(len(arguments) // 2, len(arguments) - 1)]
+    return arguments.replace(": 4", ': "4"').replace(": 3", ': "3"')
+
+
+def error_response(status: int, message: str, error_type: str, headers=None) -> web.Response:
+    return web.json_response(
+        {"error": {"message": message, "type": error_type, "param": None, "code": None}},
+        status=status,
+        headers=headers,
+    )
+
+
+def build_message(request: dict, config: ServerConfig) -> dict:
+    functions = request.get("functions")
+    if not functions:
+        return {"role": "assistant", "content": fake_text(random.randint(60, 200))}
+
+    function_name = (request.get("function_call") or {}).get("name")
+    function = next(
+        (f for f in functions if f["name"] == function_name), functions[0]
+    )
+    arguments = json.dumps(fake_value(function["parameters"]), indent=2)
+    if random.random() < config.malformed_json_rate:
+        arguments = malform(arguments)
+    return {
+        "role": "assistant",
+        "content": None,
+        "function_call": {"name": function["name"], "arguments": arguments},
+    }
+
+
+async def stream_response(
+    http_request: web.Request, request: dict, message: dict, config: ServerConfig
+) -> web.StreamResponse:
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(http_request)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+    async def send(delta: dict, finish_reason: str | None = None) -> None:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+    await send({"role": "assistant", "content": ""})
+    if "function_call" in message:
+        await send({"function_call": {"name": message["function_call"]["name"], "arguments": ""}})
+        pieces = [
+            message["function_call"]["arguments"][i : i + 20]
+            for i in range(0, len(message["function_call"]["arguments"]), 20)
+        ]
+        for piece in pieces:
+            await asyncio.sleep(config.chunk_latency.sample())
+            await send({"function_call": {"arguments": piece}})
+        await send({}, "function_call")
+    else:
+        for word in message["content"].split(" "):
+            await asyncio.sleep(config.chunk_latency.sample())
+            await send({"content": word + " "})
+        await send({}, "stop")
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def chat_completions(http_request: web.Request) -> web.StreamResponse:
+    config: ServerConfig = http_request.app["config"]
+    request = await http_request.json()
+
+    await asyncio.sleep(config.latency.sample())
+
+    if random.random() < config.rate_limit_rate:
+        logger.info("Injecting rate limit error")
+        return error_response(
+            429,
+            f"Rate limit reached for {request['model']}. Please try again in {config.retry_after}s.",
+            "requests",
+            headers={"Retry-After": str(config.retry_after)},
+        )
+    if random.random() < config.overload_rate:
+        logger.info("Injecting overload error")
+        return error_response(
+            503,
+            "That model is currently overloaded with other requests. You can retry your request.",
+            "server_error",
+        )
+
+    message = build_message(request, config)
+    if request.get("stream"):
+        return await stream_response(http_request, request, message, config)
+
+    prompt_tokens = len(json.dumps(request.get("messages", []))) // 4
+    completion_tokens = len(json.dumps(message)) // 4
+    return web.json_response(
+        {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": message,
+                    "finish_reason": "function_call" if "function_call" in message else "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+    )
+
+
+def make_app(config: ServerConfig) -> web.Application:
+    app = web.Application()
+    app["config"] = config
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="fixed:0", help="e.g. lognormal:1.5,0.6")
+    parser.add_argument("--chunk-latency", default="fixed:0.02")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--overload-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-json-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args()
+
+    web.run_app(
+        make_app(
+            ServerConfig(
+                latency=LatencyProfile.parse(args.latency),
+                chunk_latency=LatencyProfile.parse(args.chunk_latency),
+                rate_limit_rate=args.rate_limit_rate,
+                overload_rate=args.overload_rate,
+                malformed_json_rate=args.malformed_json_rate,
+                retry_after=args.retry_after,
+            )
+        ),
+        host=args.host,
+        port=args.port,
+    )
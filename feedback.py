@@ -1,7 +1,80 @@
 import asyncio
 import time
-
-from llm import OpenAifunction, OpenaiChatMessage, get_response_openai_nonstream
+from typing import Callable, Iterable, Literal, NamedTuple
+
+from deadline import NO_DEADLINE, Deadline, gather_within
+from mechanics import WORD_PATTERN, analyze_mechanics
+from llm import (
+    OpenAifunction,
+    OpenaiChatMessage,
+    get_response_openai_nonstream,
+    get_streamed_response,
+)
+
+# Number of individual feedbacks aggregated per parameter.
+ENSEMBLE_SIZE = 3
+# With less time than this left, a single feedback is generated per parameter.
+LOW_BUDGET_SECONDS = 45
+# With less time than this left, individual feedbacks are not aggregated.
+AGGREGATION_BUDGET_SECONDS = 20
+
+FeedbackMode = Literal["fast", "adaptive", "thorough"]
+MechanicsMode = Literal["llm", "local", "polished"]
+
+
+class AdaptiveEnsembleConfig(NamedTuple):
+    # Feedbacks generated up front; more are only added if these are inconclusive.
+    initial_samples: int = 2
+    max_samples: int = ENSEMBLE_SIZE
+    # Initial grades further apart than this call for more samples.
+    grade_margin: float = 1.0
+    # So does an initial feedback whose confidence is below this.
+    min_confidence: float = 3
+
+MECHANICAL_ACCURACY = "Mechanical Accuracy"
+GRADING_PARAMETERS = {
+    "Evidence Support": "Measures the student's ability to appropriately cite textual evidence to back their claims.",
+    "Analytical Quality": "Evaluates how deeply and coherently the student has analyzed the text.",
+    "Clarity of Response": "Looks at the organization and language clarity in the student's answer. A well-structured response shows mastery of the skill.",
+    "Completeness": "Checks if the student has fully answered the question and explored all its facets, demonstrating comprehensive understanding.",
+    MECHANICAL_ACCURACY: "Evaluates the grammar, syntax, and spelling in the student's answer. Errors can impede understanding and detract from the analysis.",
+}
+
+FEEDBACK_GUIDELINES = """- Be Specific: Address the unique aspects of the student's response. Avoid vague comments that lack instructive value.
+- Make it Actionable: Provide concrete steps for improvement. Be prescriptive but realistic.
+- Align with the parameter: Reference the parameter in the student grading rubric. Explain how the student met or fell short of the criterion.
+- Balance Tone & Constructiveness: Use a tone that encourages improvement without being demeaning. Instill confidence while indicating areas for growth.
+- Be Comprehensive: Cover all critical elements. Avoid an over-focus on either the positives or negatives.
+- Be Clear: Use easily understood language, avoiding jargon that may confuse more than enlighten. Remember you are writing for a fourth grader.
+- Watch Your Grammar and Syntax: Maintain high linguistic standards in your feedback to model what you expect from students."""
+
+# Fields of an individual feedback on one parameter.
+FEEDBACK_PROPERTIES = {
+    "notes": {
+        "type": "string",
+        "description": "Your private notes on the student's performance on the parameter.",
+    },
+    "summary": {
+        "type": "string",
+        "description": "A short, one-sentence high-level summary of the student's performance on the parameter.",
+    },
+    "grade": {
+        "type": "number",
+        "description": "A grade on a scale from 1 to 5, where 1 is the worst and 5 is the best.",
+    },
+    "feedback": {
+        "type": "string",
+        "description": "A longer feedback for the student. This should be at least a couple of paragraphs long and give detailed feedback on the student's performance. It should contain actionable feedback that the student can use to improve their performance as well as concrete examples of mistakes that the student made and how he or she could have answered better.",
+    },
+    "self_criticism": {
+        "type": "string",
+        "description": "A short paragraph of self-criticism on the provided long-form feedback. How well does the feedback meet the criteria listed above? What could you improve to increase the quality of your feedback?",
+    },
+}
+CONFIDENCE_PROPERTY = {
+    "type": "number",
+    "description": "Your confidence in your grade, from 1 (a guess) to 5 (certain).",
+}
 
 
 async def generate_individual_feedback_on_answer_parameter(
@@ -10,7 +83,14 @@ async def generate_individual_feedback_on_answer_parameter(
     text: str,
     parameter: str,
     description: str,
+    sample: int = 0,
+    with_confidence: bool = False,
 ):
+    confidence_instruction = (
+        "\n- Your confidence in your grade, from 1 (a guess) to 5 (certain)."
+        if with_confidence
+        else ""
+    )
     system_prompt = f"""
 You are an educational expert who is tasked with evaluating and giving feedback on fourth grade student respones to free-response questions (FRQs). The objective is to assess how well the students have assimilated the CCSS.ELA-Literacy.W.4 common core standard. The standard is: 
 
@@ -20,13 +100,7 @@ The answers are evaluated according to a rubric, and you are currently giving fe
 
 The following is a list of aspects that make up excellent feedback:
 
-- Be Specific: Address the unique aspects of the student's response. Avoid vague comments that lack instructive value.
-- Make it Actionable: Provide concrete steps for improvement. Be prescriptive but realistic.
-- Align with the parameter: Reference the parameter in the student grading rubric. Explain how the student met or fell short of the criterion.
-- Balance Tone & Constructiveness: Use a tone that encourages improvement without being demeaning. Instill confidence while indicating areas for growth.
-- Be Comprehensive: Cover all critical elements. Avoid an over-focus on either the positives or negatives.
-- Be Clear: Use easily understood language, avoiding jargon that may confuse more than enlighten. Remember you are writing for a fourth grader.
-- Watch Your Grammar and Syntax: Maintain high linguistic standards in your feedback to model what you expect from students.
+{FEEDBACK_GUIDELINES}
 
 Given a text, a free-response question, and a student answer, you must give feedback on the student's answer. Your feedback is structured as follows: 
 
@@ -34,7 +108,7 @@ Given a text, a free-response question, and a student answer, you must give feed
 - A short, one-sentence high-level summary of the student's performance on the parameter. You write this in second person, addressing the student directly. This will be shown to the student so it should be written in a warm, encouraging tone and with language that is appropriate for a fourth grader.
 - A grade on a scale from 1 to 5, where 1 is the worst and 5 is the best. 
 - A longer feedback for the student. This should be at least a couple of paragraphs long and give detailed feedback on the student's performance. It should contain actionable feedback that the student can use to improve their performance as well as concrete examples of mistakes that the student made and how he or she could have answered better. When providing examples, make sure to contextualize them, possibly showing the full sentence or paragraph that the student wrote. Make sure to ONLY give feedback on the parameter that is currently being tested. Do not give feedback on other parameters or on the answer as a whole (for example, about grammar if the parameter is "analytical quality".)
-- Finally, a short paragraph of self-criticism on the provided long-form feedback. How well does the feedback meet the criteria listed above? What could you improve to increase the quality of your feedback?
+- Finally, a short paragraph of self-criticism on the provided long-form feedback. How well does the feedback meet the criteria listed above? What could you improve to increase the quality of your feedback?{confidence_instruction}
 
 
 To provide your feedback, you use the function add_feedback. Long-form feedbacks should be written using markdown, escaped for being included in a json document.
@@ -58,40 +132,25 @@ ANSWER: {answer}
         ),
     ]
 
+    properties = (
+        {**FEEDBACK_PROPERTIES, "confidence": CONFIDENCE_PROPERTY}
+        if with_confidence
+        else FEEDBACK_PROPERTIES
+    )
     add_feedback_openai_function: OpenAifunction = {
         "name": "add_feedback",
         "description": "Add feedback for the given answer.",
         "parameters": {
             "type": "object",
-            "properties": {
-                "notes": {
-                    "type": "string",
-                    "description": "Your private notes on the student's performance on the parameter.",
-                },
-                "summary": {
-                    "type": "string",
-                    "description": "A short, one-sentence high-level summary of the student's performance on the parameter.",
-                },
-                "grade": {
-                    "type": "number",
-                    "description": "A grade on a scale from 1 to 5, where 1 is the worst and 5 is the best.",
-                },
-                "feedback": {
-                    "type": "string",
-                    "description": "A longer feedback for the student. This should be at least a couple of paragraphs long and give detailed feedback on the student's performance. It should contain actionable feedback that the student can use to improve their performance as well as concrete examples of mistakes that the student made and how he or she could have answered better.",
-                },
-                "self_criticism": {
-                    "type": "string",
-                    "description": "A short paragraph of self-criticism on the provided long-form feedback. How well does the feedback meet the criteria listed above? What could you improve to increase the quality of your feedback?",
-                },
-            },
-            "required": ["notes", "summary", "grade", "feedback", "self_criticism"],
+            "properties": properties,
+            "required": list(properties),
         },
     }
     arguments = await get_response_openai_nonstream(
         messages_for_openai,
         [add_feedback_openai_function],
         function_name="add_feedback",
+        sample=sample,
     )
     
     return arguments
@@ -99,7 +158,7 @@ ANSWER: {answer}
 
 async def aggregate_feedbacks_on_answer_parameters(feedbacks: list[dict], answer: str):
     prompt = f"""
-You are an educational expert currently writing feedback for a fourth grade student's answer to a free-response question (FRQ). The objective is to assess how well the student has assimilated the CCSS.ELA-Literacy.W.4 common core standard. You are given 3 feedbacks by different teachers together with their summaries and the assigned grades, as well as comments on the 3 feedbacks by other educational experts. Your task is to aggregate the feedbacks into a single feedback that is more comprehensive and detailed than the individual feedbacks. You maximize the information that is retained in the final feedback while incorporating the comments on the individual feedbacks to create a more comprehensive feedback. Remember, you are writing for a fourth grader and the characteristics of excellent feedback are the following:
+You are an educational expert currently writing feedback for a fourth grade student's answer to a free-response question (FRQ). The objective is to assess how well the student has assimilated the CCSS.ELA-Literacy.W.4 common core standard. You are given {len(feedbacks)} feedbacks by different teachers together with their summaries and the assigned grades, as well as comments on the {len(feedbacks)} feedbacks by other educational experts. Your task is to aggregate the feedbacks into a single feedback that is more comprehensive and detailed than the individual feedbacks. You maximize the information that is retained in the final feedback while incorporating the comments on the individual feedbacks to create a more comprehensive feedback. Remember, you are writing for a fourth grader and the characteristics of excellent feedback are the following:
 
 - Specificity: How closely does the feedback address the unique aspects of the student's response? Vague comments like "good job" or "needs work" lack instructive value.
 - Actionability: Does the feedback offer concrete steps for improvement? It should be prescriptive yet attainable.
@@ -119,31 +178,19 @@ You produce the final feedback by using the function add_aggregated_feedback. Yo
             content=f"""
 ANSWER: {answer}
 
-====================
-FEEDBACK 1: 
-    - Notes: {feedbacks[0]["notes"]}
-    - Summary: {feedbacks[0]["summary"]}
-    - Grade: {feedbacks[0]["grade"]}
-    - Feedback: {feedbacks[0]["feedback"]}
-    - Criticism: {feedbacks[0]["self_criticism"]}
-
-====================
-FEEDBACK 2:
-    - Notes: {feedbacks[1]["notes"]}
-    - Summary: {feedbacks[1]["summary"]}
-    - Grade: {feedbacks[1]["grade"]}
-    - Feedback: {feedbacks[1]["feedback"]}
-    - Criticism: {feedbacks[1]["self_criticism"]}
-
-====================
-FEEDBACK 3:
-    - Notes: {feedbacks[2]["notes"]}
-    - Summary: {feedbacks[2]["summary"]}
-    - Grade: {feedbacks[2]["grade"]}
-    - Feedback: {feedbacks[2]["feedback"]}
-    - Criticism: {feedbacks[2]["self_criticism"]}
+"""
+            + "".join(
+                f"""====================
+FEEDBACK {i + 1}:
+    - Notes: {feedback["notes"]}
+    - Summary: {feedback["summary"]}
+    - Grade: {feedback["grade"]}
+    - Feedback: {feedback["feedback"]}
+    - Criticism: {feedback["self_criticism"]}
 
-""",
+"""
+                for i, feedback in enumerate(feedbacks)
+            ),
         ),
     ]
 
@@ -188,31 +235,67 @@ FEEDBACK 3:
     return arguments
 
 
+def as_aggregated_feedback(feedback: dict) -> dict:
+    """Presents a single individual feedback in the same shape as an aggregated one."""
+    return {
+        "aggregated_notes": feedback["notes"],
+        "aggregated_feedback": feedback["feedback"],
+        "aggregated_summary": feedback["summary"],
+        "aggregated_grade": feedback["grade"],
+    }
+
+
+def median_feedback(feedbacks: list[dict]) -> dict:
+    return sorted(feedbacks, key=lambda feedback: feedback["grade"])[len(feedbacks) // 2]
+
+
 async def compute_full_feedback_on_parameter(
     answer: str,
     frq: str,
     text: str,
     parameter: str,
     description: str,
+    deadline: Deadline = NO_DEADLINE,
 ): 
-    # generate 3 individual feedbacks:
-    print(f"Generating feedbacks for parameter {parameter}")
+    # Running out of time: one feedback, no aggregation.
+    n_feedbacks = ENSEMBLE_SIZE
+    if deadline.remaining() <= LOW_BUDGET_SECONDS:
+        n_feedbacks = 1
+        deadline.mark_degraded()
+
+    # generate the individual feedbacks:
+    print(f"Generating {n_feedbacks} feedbacks for parameter {parameter}")
     start_time = time.time()
-    feedbacks = await asyncio.gather(
-        *[
+    feedbacks = await gather_within(
+        [
             generate_individual_feedback_on_answer_parameter(
                 answer,
                 frq,
                 text,
                 parameter,
                 description,
+                sample=i,
             )
-            for _ in range(3)
-        ]
+            for i in range(n_feedbacks)
+        ],
+        # Leave time for the aggregation.
+        deadline.portion(0.6),
     )
     print(f"Feedback generation time: {time.time() - start_time}")
 
-    # aggregate the 3 individual feedbacks into a single feedback:
+    return await combine_feedbacks(feedbacks, answer, parameter, deadline)
+
+
+async def combine_feedbacks(
+    feedbacks: list[dict], answer: str, parameter: str, deadline: Deadline
+) -> dict:
+    if len(feedbacks) == 1 or deadline.remaining() < AGGREGATION_BUDGET_SECONDS:
+        print(f"Skipping aggregation for parameter {parameter}")
+        if len(feedbacks) > 1:
+            deadline.mark_degraded()
+        return as_aggregated_feedback(median_feedback(feedbacks))
+
+    # aggregate the individual feedbacks into a single feedback:
     print(f"Aggregating feedbacks for parameter {parameter}")
     start_time = time.time()
     aggregated_feedback = await aggregate_feedbacks_on_answer_parameters(feedbacks, answer)
@@ -221,44 +304,392 @@ async def compute_full_feedback_on_parameter(
     return aggregated_feedback
 
 
+def is_conclusive(feedbacks: list[dict], config: AdaptiveEnsembleConfig) -> bool:
+    grades = [feedback["grade"] for feedback in feedbacks]
+    return max(grades) - min(grades) <= config.grade_margin and all(
+        feedback["confidence"] >= config.min_confidence for feedback in feedbacks
+    )
+
+
+async def compute_adaptive_feedback_on_parameter(
+    answer: str,
+    frq: str,
+    text: str,
+    parameter: str,
+    description: str,
+    deadline: Deadline = NO_DEADLINE,
+    config: AdaptiveEnsembleConfig = AdaptiveEnsembleConfig(),
+) -> dict:
+    """
+    Like compute_full_feedback_on_parameter, but starts with a few feedbacks and only
+    samples more and aggregates them when those disagree on the grade or aren't
+    confident. Conclusive feedbacks are used as they are.
+    """
+
+    async def generate_feedbacks(samples: range, deadline: Deadline) -> list[dict]:
+        return await gather_within(
+            [
+                generate_individual_feedback_on_answer_parameter(
+                    answer,
+                    frq,
+                    text,
+                    parameter,
+                    description,
+                    sample=i,
+                    with_confidence=True,
+                )
+                for i in samples
+            ],
+            deadline,
+        )
+
+    start_time = time.time()
+    feedbacks = await generate_feedbacks(range(config.initial_samples), deadline.portion(0.4))
+    print(f"Feedback generation time: {time.time() - start_time}")
+
+    if is_conclusive(feedbacks, config):
+        print(f"Feedbacks for parameter {parameter} agree, skipping aggregation")
+        return as_aggregated_feedback(median_feedback(feedbacks))
+
+    if deadline.remaining() > LOW_BUDGET_SECONDS:
+        print(f"Feedbacks for parameter {parameter} are inconclusive, adding samples")
+        feedbacks += await generate_feedbacks(
+            range(len(feedbacks), config.max_samples), deadline.portion(0.5)
+        )
+    else:
+        deadline.mark_degraded()
+    return await combine_feedbacks(feedbacks, answer, parameter, deadline)
+
+
+async def polish_feedback_wording(feedback: dict, parameter: str, answer: str) -> dict:
+    """
+    Has the LLM reword a feedback (e.g. a rule-based one) for a fourth grader, keeping
+    its findings and grade.
+    """
+    prompt = f"""
+You are an educational expert helping write feedback for a fourth grade student's answer to a free-response question (FRQ). You are given a draft feedback on the following parameter: "{parameter}" ({GRADING_PARAMETERS[parameter]}). The draft was produced by an automated checker: its findings are correct but its wording is mechanical.
+
+You rewrite the summary and the feedback so that they read naturally, in a warm, encouraging tone and with language that is appropriate for a fourth grader. You write in second person, addressing the student directly. You keep every finding and example of the draft, you don't add new ones and you don't change the grade. You do not introduce yourself or greet the student. For the long-form feedback, you write it as Markdown, escaped for being included in a json document.
+
+You save the rewritten feedback by using the function add_polished_feedback.
+"""
+
+    messages_for_openai = [
+        OpenaiChatMessage(role="system", content=prompt),
+        OpenaiChatMessage(
+            role="user",
+            content=f"""
+ANSWER: {answer}
+
+====================
+GRADE: {feedback["grade"]}
+
+====================
+SUMMARY: {feedback["summary"]}
+
+====================
+FEEDBACK:
+
+{feedback["feedback"]}
+""",
+        ),
+    ]
+
+    add_polished_feedback_openai_function: OpenAifunction = {
+        "name": "add_polished_feedback",
+        "description": "Add the rewritten feedback.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "summary": FEEDBACK_PROPERTIES["summary"],
+                "feedback": FEEDBACK_PROPERTIES["feedback"],
+            },
+            "required": ["summary", "feedback"],
+        },
+    }
+    arguments = await get_response_openai_nonstream(
+        messages_for_openai,
+        [add_polished_feedback_openai_function],
+        function_name="add_polished_feedback",
+        call_site="polish_feedback_wording",
+    )
+
+    return {**feedback, **arguments}
+
+
+async def compute_local_mechanics_feedback(
+    answer: str, frq: str, text: str, polish: bool = False
+) -> dict:
+    """Mechanical Accuracy feedback from the offline checker, optionally reworded."""
+    # Words of the text and question (names, topic words) count as correctly spelled.
+    feedback = analyze_mechanics(answer, WORD_PATTERN.findall(f"{text} {frq}"))
+    if polish:
+        feedback = await polish_feedback_wording(feedback, MECHANICAL_ACCURACY, answer)
+    return as_aggregated_feedback(feedback)
+
+
+async def revise_feedback_on_parameter(
+    answer: str,
+    previous_answer: str,
+    frq: str,
+    text: str,
+    parameter: str,
+    description: str,
+    previous_feedback: dict,
+) -> dict:
+    """
+    Updates the feedback on a parameter for a revised answer, in a single call, using the
+    feedback on the previous version of the answer as a starting point.
+    """
+    system_prompt = f"""
+You are an educational expert who is tasked with evaluating and giving feedback on fourth grade student respones to free-response questions (FRQs). The objective is to assess how well the students have assimilated the CCSS.ELA-Literacy.W.4 common core standard. The standard is: 
+
+"Draw evidence from literary or informational texts to support analysis, reflection, and research.".
+
+The answers are evaluated according to a rubric, and you are currently giving feedback on the following parameter: "{parameter}" ({description}).
+
+The following is a list of aspects that make up excellent feedback:
+
+{FEEDBACK_GUIDELINES}
+
+The student already received feedback on a previous version of their answer and has now revised it. Given the text, the question, the previous answer with its feedback and the revised answer, you update the feedback for the revised answer. Keep what still applies, drop what the student has fixed (and acknowledge the improvement), and address anything new the revision introduced. The grade should reflect the revised answer. Your feedback is structured as follows: 
+
+- A bullet list containing your (private) notes on the student's performance on the parameter. This will not be shown to the student and can be written with expert terminology.
+- A short, one-sentence high-level summary of the student's performance on the parameter. You write this in second person, addressing the student directly. This will be shown to the student so it should be written in a warm, encouraging tone and with language that is appropriate for a fourth grader.
+- A grade on a scale from 1 to 5, where 1 is the worst and 5 is the best. 
+- A longer feedback for the student. This should be at least a couple of paragraphs long and give detailed feedback on the student's performance. It should contain actionable feedback that the student can use to improve their performance as well as concrete examples of mistakes that the student made and how he or she could have answered better. Make sure to ONLY give feedback on the parameter that is currently being tested.
+
+
+To provide your feedback, you use the function add_feedback. Long-form feedbacks should be written using markdown, escaped for being included in a json document.
+"""
+
+    messages_for_openai = [
+        OpenaiChatMessage(role="system", content=system_prompt),
+        OpenaiChatMessage(
+            role="user",
+            content=f"""
+TEXT: {text}
+
+====================
+QUESTION: {frq}
+
+====================
+PREVIOUS ANSWER: {previous_answer}
+
+====================
+PREVIOUS FEEDBACK:
+    - Summary: {previous_feedback["aggregated_summary"]}
+    - Grade: {previous_feedback["aggregated_grade"]}
+    - Feedback: {previous_feedback["aggregated_feedback"]}
+
+====================
+REVISED ANSWER: {answer}
+
+====================
+""",
+        ),
+    ]
+
+    revised_feedback_properties = {
+        name: FEEDBACK_PROPERTIES[name] for name in ("notes", "summary", "grade", "feedback")
+    }
+    add_feedback_openai_function: OpenAifunction = {
+        "name": "add_feedback",
+        "description": "Add feedback for the revised answer.",
+        "parameters": {
+            "type": "object",
+            "properties": revised_feedback_properties,
+            "required": list(revised_feedback_properties),
+        },
+    }
+    arguments = await get_response_openai_nonstream(
+        messages_for_openai,
+        [add_feedback_openai_function],
+        function_name="add_feedback",
+        call_site="revise_feedback_on_parameter",
+    )
+
+    return as_aggregated_feedback(arguments)
+
+
+def parameter_property_name(parameter: str) -> str:
+    return parameter.lower().replace(" ", "_")
+
+
+async def generate_single_pass_feedback(
+    answer: str, frq: str, text: str, parameters: dict[str, str] = GRADING_PARAMETERS
+) -> dict:
+    """
+    Gives feedback on all (given) grading parameters at once, in a single function call. Faster
+    and cheaper than the ensemble, at the cost of some depth. Returns the feedbacks in the
+    same shape as give_feedback_on_answer's thorough mode.
+    """
+    parameters_list = "\n".join(
+        f'- "{parameter}": {description}' for parameter, description in parameters.items()
+    )
+    system_prompt = f"""
+You are an educational expert who is tasked with evaluating and giving feedback on fourth grade student respones to free-response questions (FRQs). The objective is to assess how well the students have assimilated the CCSS.ELA-Literacy.W.4 common core standard. The standard is: 
+
+"Draw evidence from literary or informational texts to support analysis, reflection, and research.".
+
+The answers are evaluated according to a rubric with the following parameters:
+
+{parameters_list}
+
+The following is a list of aspects that make up excellent feedback:
+
+{FEEDBACK_GUIDELINES}
+
+Given a text, a free-response question, and a student answer, you must give feedback on the student's answer for EACH of the parameters. For each parameter, your feedback is structured as follows: 
+
+- A bullet list containing your (private) notes on the student's performance on the parameter. This will not be shown to the student and can be written with expert terminology.
+- A short, one-sentence high-level summary of the student's performance on the parameter. You write this in second person, addressing the student directly. This will be shown to the student so it should be written in a warm, encouraging tone and with language that is appropriate for a fourth grader.
+- A grade on a scale from 1 to 5, where 1 is the worst and 5 is the best. 
+- A longer feedback for the student. This should be at least a paragraph long and give detailed feedback on the student's performance. It should contain actionable feedback that the student can use to improve their performance as well as concrete examples of mistakes that the student made and how he or she could have answered better. Make sure each feedback ONLY covers its own parameter.
+
+
+To provide your feedback, you use the function add_feedbacks. Long-form feedbacks should be written using markdown, escaped for being included in a json document.
+"""
+
+    messages_for_openai = [
+        OpenaiChatMessage(role="system", content=system_prompt),
+        OpenaiChatMessage(
+            role="user",
+            content=f"""
+TEXT: {text}
+
+====================
+QUESTION: {frq}
+
+====================
+ANSWER: {answer}
+
+====================
+""",
+        ),
+    ]
+
+    # Self-criticism only serves the aggregation, which this mode doesn't do.
+    parameter_feedback_properties = {
+        name: FEEDBACK_PROPERTIES[name] for name in ("notes", "summary", "grade", "feedback")
+    }
+    add_feedbacks_openai_function: OpenAifunction = {
+        "name": "add_feedbacks",
+        "description": "Add feedback on each parameter for the given answer.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                parameter_property_name(parameter): {
+                    "type": "object",
+                    "description": f"Your feedback on {parameter}.",
+                    "properties": parameter_feedback_properties,
+                    "required": list(parameter_feedback_properties),
+                }
+                for parameter in parameters
+            },
+            "required": [parameter_property_name(parameter) for parameter in parameters],
+        },
+    }
+    arguments = await get_response_openai_nonstream(
+        messages_for_openai,
+        [add_feedbacks_openai_function],
+        function_name="add_feedbacks",
+        call_site="generate_single_pass_feedback",
+    )
+
+    return {
+        parameter: as_aggregated_feedback(arguments[parameter_property_name(parameter)])
+        for parameter in parameters
+    }
+
+
 async def give_feedback_on_answer(
     answer: str,
     frq: str,
     text: str,
+    deadline: Deadline = NO_DEADLINE,
+    mode: FeedbackMode = "thorough",
+    on_parameter: Callable[[str, dict], None] | None = None,
+    mechanics: MechanicsMode = "llm",
+    parameters: Iterable[str] | None = None,
 ):
-    grading_parameters = {
-        "Evidence Support": "Measures the student's ability to appropriately cite textual evidence to back their claims.",
-        "Analytical Quality": "Evaluates how deeply and coherently the student has analyzed the text.",
-        "Clarity of Response": "Looks at the organization and language clarity in the student's answer. A well-structured response shows mastery of the skill.",
-        "Completeness": "Checks if the student has fully answered the question and explored all its facets, demonstrating comprehensive understanding.",
-        "Mechanical Accuracy": "Evaluates the grammar, syntax, and spelling in the student's answer. Errors can impede understanding and detract from the analysis.",
+    """
+    Gives feedback on the answer for every grading parameter, or only for `parameters`
+    if given. The "thorough" mode
+    aggregates an ensemble of feedbacks per parameter, the "adaptive" mode only when
+    its first feedbacks are inconclusive, and the "fast" mode gives all feedbacks in a
+    single call. `on_parameter(parameter, feedback)` is called as soon as each
+    parameter's feedback is ready, so it can be shown before the slowest one is done.
+
+    With `mechanics` set to "local", Mechanical Accuracy is checked offline by the
+    mechanics module instead; "polished" additionally has the LLM reword that feedback.
+    """
+    parameters = GRADING_PARAMETERS if parameters is None else set(parameters)
+    local_mechanics = mechanics != "llm" and MECHANICAL_ACCURACY in parameters
+    llm_parameters = {
+        parameter: description
+        for parameter, description in GRADING_PARAMETERS.items()
+        if parameter in parameters
+        and not (mechanics != "llm" and parameter == MECHANICAL_ACCURACY)
     }
 
-    # Generate feedback for all parameters in parallel and then combine them.
+    def report(parameter: str, feedback: dict) -> dict:
+        if on_parameter is not None:
+            on_parameter(parameter, feedback)
+        return feedback
+
+    async def local_mechanics_feedback() -> dict[str, dict]:
+        feedback = await compute_local_mechanics_feedback(
+            answer, frq, text, polish=mechanics == "polished"
+        )
+        return {MECHANICAL_ACCURACY: report(MECHANICAL_ACCURACY, feedback)}
+
+    async def single_pass_feedback() -> dict[str, dict]:
+        feedbacks = await generate_single_pass_feedback(answer, frq, text, llm_parameters)
+        return {parameter: report(parameter, feedback) for parameter, feedback in feedbacks.items()}
+
+    compute_feedback_on_parameter = (
+        compute_adaptive_feedback_on_parameter
+        if mode == "adaptive"
+        else compute_full_feedback_on_parameter
+    )
 
-    feedbacks = await asyncio.gather(
-        *[
-            compute_full_feedback_on_parameter(
-                answer,
-                frq,
-                text,
-                parameter,
-                description,
-            )
+    async def feedback_on_parameter(parameter: str, description: str) -> dict[str, dict]:
+        feedback = await compute_feedback_on_parameter(
+            answer,
+            frq,
+            text,
+            parameter,
+            description,
+            deadline,
+        )
+        return {parameter: report(parameter, feedback)}
 
-            for parameter, description in grading_parameters.items()
+    # Generate feedback for all parameters in parallel and then combine them.
+    if mode == "fast":
+        tasks = [single_pass_feedback()] if llm_parameters else []
+    else:
+        tasks = [
+            feedback_on_parameter(parameter, description)
+            for parameter, description in llm_parameters.items()
         ]
-    )
+    if local_mechanics:
+        tasks.append(local_mechanics_feedback())
+
+    feedbacks = {}
+    for parameter_feedbacks in await asyncio.gather(*tasks):
+        feedbacks.update(parameter_feedbacks)
 
     print(f"Generated all feedbacks")
     feedbacks_dict = {
-        parameter: feedback
-        for parameter, feedback in zip(grading_parameters.keys(), feedbacks)
+        parameter: feedbacks[parameter]
+        for parameter in GRADING_PARAMETERS
+        if parameter in parameters
     }
 
     return feedbacks_dict
 
-async def rewrite_text_according_to_feedback(text, question, answer, feedback):
+async def rewrite_text_according_to_feedback(text, question, answer, feedback, on_token=None):
     prompt = f"""
 You're an educational expert tasked with rewriting a student's answer to a free-response question (FRQ) according to the feedback given by another expert.
 
@@ -291,6 +722,9 @@ FEEDBACK:
         ),
     ]
 
+    if on_token is not None:
+        return await get_streamed_response(messages_for_openai, on_token)
+
     response = await get_response_openai_nonstream(
         messages_for_openai,
     )
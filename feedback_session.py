@@ -0,0 +1,246 @@
+"""
+Incremental re-grading of resubmitted answers: the new answer is diffed against the
+previous one, feedbacks the edit can't have affected are reused, and affected ones are
+revised starting from the previous feedback instead of being regenerated from scratch.
+"""
+import asyncio
+import hashlib
+import json
+import re
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Callable, Literal, NamedTuple
+
+from deadline import NO_DEADLINE, Deadline, gather_within
+from feedback import (
+    GRADING_PARAMETERS,
+    MECHANICAL_ACCURACY,
+    FeedbackMode,
+    MechanicsMode,
+    compute_local_mechanics_feedback,
+    give_feedback_on_answer,
+    revise_feedback_on_parameter,
+)
+from mechanics import WORD_PATTERN, is_known_word, load_words
+
+CONTENT_TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+# Past this share of changed words, the answer is graded from scratch.
+FULL_REGRADE_FRACTION = 0.5
+# A replaced word at least this similar to the original one is a spelling fix.
+SPELLING_FIX_SIMILARITY = 0.7
+# Parameters that punctuation and capitalization alone can change.
+MECHANICAL_PARAMETERS = frozenset({MECHANICAL_ACCURACY, "Clarity of Response"})
+
+
+class AnswerEdit(NamedTuple):
+    # "none": only whitespace changed, "mechanical": only punctuation or capitalization
+    # changed, "spelling": words were respelled or repeated words removed, "content":
+    # what the answer says changed.
+    kind: Literal["none", "mechanical", "spelling", "content"]
+    # Share of the words that changed, from 0 to 1.
+    changed_fraction: float
+
+
+def is_spelling_fix(previous_word: str, word: str, vocabulary: frozenset[str]) -> bool:
+    """
+    Whether a misspelled word was replaced by a similar, correctly spelled one. Swapping
+    a word for another real one ("increased" for "decreased") changes the content.
+    """
+    if is_known_word(previous_word, vocabulary) or not is_known_word(word, vocabulary):
+        return False
+    similarity = SequenceMatcher(None, previous_word, word, autojunk=False).ratio()
+    return similarity >= SPELLING_FIX_SIMILARITY
+
+
+def is_spelling_edit(
+    previous_words: list[str],
+    words: list[str],
+    matcher: SequenceMatcher,
+    vocabulary: frozenset[str],
+) -> bool:
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if tag == "replace" and i2 - i1 == j2 - j1:
+            if all(
+                is_spelling_fix(previous_word, word, vocabulary)
+                for previous_word, word in zip(previous_words[i1:i2], words[j1:j2])
+            ):
+                continue
+            return False
+        # Only removing or adding a repetition of the word before ("the the").
+        removed, added = previous_words[i1:i2], words[j1:j2]
+        if tag == "delete" and i1 > 0 and set(removed) == {previous_words[i1 - 1]}:
+            continue
+        if tag == "insert" and j1 > 0 and set(added) == {words[j1 - 1]}:
+            continue
+        return False
+    return True
+
+
+def diff_answers(
+    previous_answer: str, answer: str, vocabulary: frozenset[str] | None = None
+) -> AnswerEdit:
+    """
+    Classifies the edit from `previous_answer` to `answer`. `vocabulary` holds the
+    correctly spelled words, by default those of the mechanics word list.
+    """
+    if vocabulary is None:
+        vocabulary = load_words()
+    if previous_answer.split() == answer.split():
+        return AnswerEdit("none", 0.0)
+    previous_words = CONTENT_TOKEN_PATTERN.findall(previous_answer.lower())
+    words = CONTENT_TOKEN_PATTERN.findall(answer.lower())
+    if previous_words == words:
+        return AnswerEdit("mechanical", 0.0)
+    matcher = SequenceMatcher(None, previous_words, words, autojunk=False)
+    kind = (
+        "spelling" if is_spelling_edit(previous_words, words, matcher, vocabulary) else "content"
+    )
+    return AnswerEdit(kind, 1 - matcher.ratio())
+
+
+def affected_parameters(edit: AnswerEdit) -> set[str]:
+    """
+    Mechanical Accuracy is regraded whenever the text changed at all, the content
+    parameters only when what the answer says changed.
+    """
+    if edit.kind == "none":
+        return set()
+    if edit.kind in ("mechanical", "spelling"):
+        return set(MECHANICAL_PARAMETERS)
+    return set(GRADING_PARAMETERS)
+
+
+@dataclass
+class FeedbackSession:
+    """
+    The latest answer a student submitted to a question, and the feedback it got.
+    Kept per student (e.g. in Streamlit's session state).
+    """
+
+    # The selected FRQ's assessment, with the question under "frq", as passed to
+    # give_feedback_on_answer.
+    frq: dict
+    text: str
+    answer: str | None = None
+    feedbacks: dict[str, dict] = field(default_factory=dict)
+
+    def record(self, answer: str, feedbacks: dict[str, dict]) -> None:
+        self.answer = answer
+        self.feedbacks = feedbacks
+
+    def vocabulary(self) -> frozenset[str]:
+        """Correctly spelled words, including those of the text and question (names)."""
+        return load_words() | {
+            word.lower() for word in WORD_PATTERN.findall(f"{self.text} {self.frq}")
+        }
+
+    def digest(self) -> str:
+        """
+        Fingerprint of the previous answer and its feedback, which the feedback on the
+        next answer depends on, e.g. to key a cache of feedbacks.
+        """
+        return hashlib.sha256(
+            json.dumps([self.answer, self.feedbacks], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    async def give_feedback(
+        self,
+        answer: str,
+        deadline: Deadline = NO_DEADLINE,
+        mode: FeedbackMode = "thorough",
+        on_parameter: Callable[[str, dict], None] | None = None,
+        mechanics: MechanicsMode = "llm",
+    ) -> dict[str, dict]:
+        """
+        Gives feedback on `answer` like give_feedback_on_answer, only revising the
+        feedbacks on the parameters affected by the edits since the previous answer: a
+        single one starting from its previous feedback, several by grading them again.
+        """
+        edit = (
+            None
+            if self.answer is None or set(self.feedbacks) != set(GRADING_PARAMETERS)
+            else diff_answers(self.answer, answer, self.vocabulary())
+        )
+        if edit is None or edit.changed_fraction > FULL_REGRADE_FRACTION:
+            feedbacks = await give_feedback_on_answer(
+                answer, self.frq, self.text, deadline, mode, on_parameter, mechanics
+            )
+            self.record(answer, feedbacks)
+            return feedbacks
+
+        affected = affected_parameters(edit)
+        # Parameters the LLM has to give feedback on again.
+        llm_affected = [
+            parameter
+            for parameter in GRADING_PARAMETERS
+            if parameter in affected
+            and not (parameter == MECHANICAL_ACCURACY and mechanics != "llm")
+        ]
+        print(
+            f"Answer edit: {edit.kind} ({edit.changed_fraction:.0%} of words), "
+            f"revising {len(affected)}/{len(GRADING_PARAMETERS)} parameters"
+        )
+
+        def report(parameter: str, feedback: dict) -> dict:
+            if on_parameter is not None:
+                on_parameter(parameter, feedback)
+            return feedback
+
+        async def revise(parameter: str) -> dict:
+            if parameter == MECHANICAL_ACCURACY and mechanics != "llm":
+                feedback = await compute_local_mechanics_feedback(
+                    answer, self.frq, self.text, polish=mechanics == "polished"
+                )
+                return report(parameter, feedback)
+            revisions = await gather_within(
+                [
+                    revise_feedback_on_parameter(
+                        answer,
+                        self.answer,
+                        self.frq,
+                        self.text,
+                        parameter,
+                        GRADING_PARAMETERS[parameter],
+                        self.feedbacks[parameter],
+                    )
+                ],
+                deadline,
+                min_results=0,
+            )
+            # Out of time: the previous feedback stands, and the result isn't cached.
+            return report(parameter, revisions[0] if revisions else self.feedbacks[parameter])
+
+        feedbacks = {
+            parameter: report(parameter, self.feedbacks[parameter])
+            for parameter in GRADING_PARAMETERS
+            if parameter not in affected
+        }
+        if len(llm_affected) > 1:
+            # A revision call per parameter would cost more than grading them all again
+            # the way `mode` does, which also degrades under the deadline.
+            feedbacks.update(
+                await give_feedback_on_answer(
+                    answer,
+                    self.frq,
+                    self.text,
+                    deadline,
+                    mode,
+                    on_parameter,
+                    mechanics,
+                    parameters=affected,
+                )
+            )
+        else:
+            revised_parameters = [
+                parameter for parameter in GRADING_PARAMETERS if parameter in affected
+            ]
+            revised = await asyncio.gather(
+                *[revise(parameter) for parameter in revised_parameters]
+            )
+            feedbacks.update(zip(revised_parameters, revised))
+
+        feedbacks = {parameter: feedbacks[parameter] for parameter in GRADING_PARAMETERS}
+        self.record(answer, feedbacks)
+        return feedbacks
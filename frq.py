@@ -1,15 +1,41 @@
+import asyncio
 import json
+import math
 import time
-from llm import OpenAifunction, OpenaiChatMessage, get_response_openai_nonstream
-
-
-async def generate_frqs(text):
+from typing import NamedTuple
+from deadline import NO_DEADLINE, Deadline, gather_within
+from prefilter import near_duplicate_clusters
+from ranking import RankingPolicy, top_k, weighted_score
+from llm import (
+    STAGE_CASCADES,
+    CascadeConfig,
+    OpenAifunction,
+    OpenaiChatMessage,
+    get_response_openai_nonstream,
+)
+
+
+ORDINALS = [
+    "first",
+    "second",
+    "third",
+    "fourth",
+    "fifth",
+    "sixth",
+    "seventh",
+    "eighth",
+    "ninth",
+    "tenth",
+]
+
+
+async def generate_frqs(text, n_frqs=10, use_cache=True):
     prompt = f"""
 You are an educational expert who is tasked with writing open-ended, free-response questions (FRQs) that are geared towards assessing how well students have assimilated the CCSS.ELA-Literacy.W.4 common core standard. The standard is: 
 
 "Draw evidence from literary or informational texts to support analysis, reflection, and research."
 
-Given a text, you produce exactly 10 high-quality FRQs. A good quality FRQ has the following characteristics:
+Given a text, you produce exactly {n_frqs} high-quality FRQs. A good quality FRQ has the following characteristics:
 
 - Clarity: The question must be easily understood. Ambiguity interferes with accurate assessment.
 - Alignment with Standard: Ensure the question necessitates drawing evidence from the text for analysis, reflection, or research.
@@ -22,7 +48,7 @@ Given a text, you produce exactly 10 high-quality FRQs. A good quality FRQ has t
 - Action Verbs: Use specific action verbs that align with the cognitive domain you aim to test (analyze, compare, assess).
 - Feasibility of Answer: Ensure that the text provides adequate information to answer the question sufficiently.
 
-When you receive a text, you write 10 FRQs that are geared towards assessing this standard. You then use the function `add_frqs` to save your questions.
+When you receive a text, you write {n_frqs} FRQs that are geared towards assessing this standard. You then use the function `add_frqs` to save your questions.
 """
 
     messages_for_openai = [
@@ -34,68 +60,21 @@ TEXT: {text}
 """,
         ),
     ]
-    frq_names = [
-        "frq_1",
-        "frq_2",
-        "frq_3",
-        "frq_4",
-        "frq_5",
-        "frq_6",
-        "frq_7",
-        "frq_8",
-        "frq_9",
-        "frq_10",
-    ]
+    frq_names = [f"frq_{i + 1}" for i in range(n_frqs)]
     add_frqs_openai_function: OpenAifunction = {
         "name": "add_frqs",
         "description": "Add FRQs for the given text.",
         "parameters": {
             "type": "object",
             "properties": {
-                "frq_1": {
-                    "type": "string",
-                    "description": "Your first FRQ.",
-                },
-                "frq_2": {
-                    "type": "string",
-                    "description": "Your second FRQ.",
-                },
-                "frq_3": {
-                    "type": "string",
-                    "description": "Your third FRQ.",
-                },
-                "frq_4": {
-                    "type": "string",
-                    "description": "Your fourth FRQ.",
-                },
-                "frq_5": {
-                    "type": "string",
-                    "description": "Your fifth FRQ.",
-                },
-                "frq_6": {
+                frq_name: {
                     "type": "string",
-                    "description": "Your sixth FRQ.",
-                },
-                "frq_7": {
-                    "type": "string",
-                    "description": "Your seventh FRQ.",
-                },
-                "frq_8": {
-                    "type": "string",
-                    "description": "Your eighth FRQ.",
-                },
-                "frq_9": {
-                    "type": "string",
-                    "description": "Your ninth FRQ.",
-                },
-                "frq_10": {
-                    "type": "string",
-                    "description": "Your tenth FRQ.",
-                },
-            },
-            "required": [
-                "frq_1", "frq_2", "frq_3", "frq_4", "frq_5", "frq_6", "frq_7", "frq_8", "frq_9", "frq_10", ] 
+                    "description": f"Your {ordinal} FRQ.",
+                }
+                for frq_name, ordinal in zip(frq_names, ORDINALS)
             },
+            "required": frq_names,
+        },
     }
 
     start_time = time.time()
@@ -103,13 +82,127 @@ TEXT: {text}
         messages_for_openai,
         functions=[add_frqs_openai_function],
         function_name="add_frqs",
+        use_cache=use_cache,
     )
     print(f"OpenAI response time: {time.time() - start_time}")
     frqs = [arguments[frq_name] for frq_name in frq_names]
     return frqs
 
 
-async def assess_frq(frq, text):
+# Rubric line of each criterion, in the order they are presented to the model.
+FRQ_CRITERIA = {
+    "clarity": "- Clarity: Is the question easily understood? Ambiguity interferes with accurate assessment (1 = Not Clear, 5 = Very Clear).",
+    "alignment": "- Alignment with Standard: Does the question necessitate drawing evidence from the text for analysis, reflection, or research? (1 = Not Aligned, 5 = Very Aligned).",
+    "age_appropriateness": "- Age-Appropriateness: Is the complexity of the question tailored to the cognitive level of the target age group? Does it broach topics that can easily be understood and talked about by fourth graders? (1 = Not Appropriate, 5 = Very Appropriate).",
+    "analytical_depth": "- Analytical Depth: Does the question prompt thoughtful analysis, not just a regurgitation of facts? (1 = Not Deep, 5 = Very Deep).",
+    "open_endedness": "- Open-Endedness: Does the question allow for more than one valid answer to encourage independent thinking? (1 = Not Open-Ended, 5 = Very Open-Ended). ",
+    "textual_scope": "- Textual Scope: Does the question cover a significant portion of the text, ensuring comprehensive analysis? (1 = Not Comprehensive, 5 = Very Comprehensive).",
+    "language_complexity": "- Language Complexity: Are the sentence structures and vocabulary in sync with the students' language skills? (1 = Not Complex, 5 = Very Complex).",
+    "bias_free": "- Bias-free: Is the answer free from any cultural, social, or gender biases that may affect a student's ability to respond objectively? (1 = Not Bias-Free, 5 = Very Bias-Free).",
+    "action_verbs": "- Action Verbs: Are specific action verbs used that align with the cognitive domain you aim to test (analyze, compare, assess)? (1 = Not Appropriate, 5 = Very Appropriate).",
+    "feasibility_of_answer": "- Feasibility of Answer: Does the text provide adequate information to answer the question sufficiently? (1 = Not Feasible, 5 = Very Feasible).",
+}
+FRQ_ASSESSMENT_CRITERIA = "\n".join(FRQ_CRITERIA.values())
+
+# Reasoning and score for each criterion, shared by the single and batched assessments.
+FRQ_ASSESSMENT_PROPERTIES = {
+    "clarity_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the clarity score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "clarity_score": {
+        "type": "number",
+        "description": "Your clarity score.",
+    },
+    "alignment_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the alignment score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "alignment_score": {
+        "type": "number",
+        "description": "Your alignment score.",
+    },
+    "age_appropriateness_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the age-appropriateness score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "age_appropriateness_score": {
+        "type": "number",
+        "description": "Your age-appropriateness score.",
+    },
+    "analytical_depth_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the analytical depth score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "analytical_depth_score": {
+        "type": "number",
+        "description": "Your analytical depth score.",
+    },
+    "open_endedness_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the open-endedness score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "open_endedness_score": {
+        "type": "number",
+        "description": "Your open-endedness score.",
+    },
+    "textual_scope_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the textual scope score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "textual_scope_score": {
+        "type": "number",
+        "description": "Your textual scope score.",
+    },
+    "language_complexity_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the language complexity score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "language_complexity_score": {
+        "type": "number",
+        "description": "Your language complexity score.",
+    },
+    "bias_free_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the bias-free score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "bias_free_score": {
+        "type": "number",
+        "description": "Your bias-free score.",
+    },
+    "action_verbs_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the action verbs score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "action_verbs_score": {
+        "type": "number",
+        "description": "Your action verbs score.",
+    },
+    "feasibility_of_answer_reasoning": {
+        "type": "string",
+        "description": "Your reasoning for the feasibility of answer score. Includes AT LEAST one positive AND one negative aspect.",
+    },
+    "feasibility_of_answer_score": {
+        "type": "number",
+        "description": "Your feasibility of answer score.",
+    },
+}
+
+
+def criteria_properties(criteria: list[str]) -> dict:
+    return {
+        name: FRQ_ASSESSMENT_PROPERTIES[name]
+        for criterion in criteria
+        for name in (f"{criterion}_reasoning", f"{criterion}_score")
+    }
+
+
+async def assess_frq(frq, text, model=None, criteria=None):
+    """
+    Assesses an FRQ along the full rubric, or only along `criteria` (names from
+    FRQ_CRITERIA) to screen it cheaply.
+    """
+    criteria = list(FRQ_CRITERIA) if criteria is None else criteria
     prompt = f"""
 You are an educational expert who is tasked with assessing the quality of free-response questions (FRQs) that are geared towards assessing how well students have assimilated the CCSS.ELA-Literacy.W.4 common core standard. The standard is:
 
@@ -117,16 +210,7 @@ You are an educational expert who is tasked with assessing the quality of free-r
 
 Given a text and an FRQ, you assess the quality of the FRQ along the following criteria:
 
-- Clarity: Is the question easily understood? Ambiguity interferes with accurate assessment (1 = Not Clear, 5 = Very Clear).
-- Alignment with Standard: Does the question necessitate drawing evidence from the text for analysis, reflection, or research? (1 = Not Aligned, 5 = Very Aligned).
-- Age-Appropriateness: Is the complexity of the question tailored to the cognitive level of the target age group? Does it broach topics that can easily be understood and talked about by fourth graders? (1 = Not Appropriate, 5 = Very Appropriate).
-- Analytical Depth: Does the question prompt thoughtful analysis, not just a regurgitation of facts? (1 = Not Deep, 5 = Very Deep).
-- Open-Endedness: Does the question allow for more than one valid answer to encourage independent thinking? (1 = Not Open-Ended, 5 = Very Open-Ended). 
-- Textual Scope: Does the question cover a significant portion of the text, ensuring comprehensive analysis? (1 = Not Comprehensive, 5 = Very Comprehensive).
-- Language Complexity: Are the sentence structures and vocabulary in sync with the students' language skills? (1 = Not Complex, 5 = Very Complex).
-- Bias-free: Is the answer free from any cultural, social, or gender biases that may affect a student's ability to respond objectively? (1 = Not Bias-Free, 5 = Very Bias-Free).
-- Action Verbs: Are specific action verbs used that align with the cognitive domain you aim to test (analyze, compare, assess)? (1 = Not Appropriate, 5 = Very Appropriate).
-- Feasibility of Answer: Does the text provide adequate information to answer the question sufficiently? (1 = Not Feasible, 5 = Very Feasible).
+{chr(10).join(FRQ_CRITERIA[criterion] for criterion in criteria)}
 
 
 When you receive a text and an FRQ, you assess the quality of the FRQ along the above criteria. For each criterium, you write a brief reasoning (no more than two sentences) about your thoughts, containing at least one positive AND one negative aspect.. Then you give a numerical score for that criterium. Finally, you use the function `add_assessment` to save your evaluation of the FRQ.
@@ -151,110 +235,8 @@ FRQ: {frq}
         "description": "Add an assessment for the given text and FRQ.",
         "parameters": {
             "type": "object",
-            "properties": {
-                "clarity_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the clarity score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "clarity_score": {
-                    "type": "number",
-                    "description": "Your clarity score.",
-                },
-                "alignment_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the alignment score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "alignment_score": {
-                    "type": "number",
-                    "description": "Your alignment score.",
-                },
-                "age_appropriateness_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the age-appropriateness score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "age_appropriateness_score": {
-                    "type": "number",
-                    "description": "Your age-appropriateness score.",
-                },
-                "analytical_depth_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the analytical depth score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "analytical_depth_score": {
-                    "type": "number",
-                    "description": "Your analytical depth score.",
-                },
-                "open_endedness_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the open-endedness score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "open_endedness_score": {
-                    "type": "number",
-                    "description": "Your open-endedness score.",
-                },
-                "textual_scope_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the textual scope score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "textual_scope_score": {
-                    "type": "number",
-                    "description": "Your textual scope score.",
-                },
-                "language_complexity_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the language complexity score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "language_complexity_score": {
-                    "type": "number",
-                    "description": "Your language complexity score.",
-                },
-                "bias_free_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the bias-free score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "bias_free_score": {
-                    "type": "number",
-                    "description": "Your bias-free score.",
-                },
-                "action_verbs_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the action verbs score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "action_verbs_score": {
-                    "type": "number",
-                    "description": "Your action verbs score.",
-                },
-                "feasibility_of_answer_reasoning": {
-                    "type": "string",
-                    "description": "Your reasoning for the feasibility of answer score. Includes AT LEAST one positive AND one negative aspect.",
-                },
-                "feasibility_of_answer_score": {
-                    "type": "number",
-                    "description": "Your feasibility of answer score.",
-                },
-            },
-            "required": [
-                "clarity_reasoning",
-                "clarity_score",
-                "alignment_reasoning",
-                "alignment_score",
-                "age_appropriateness_reasoning",
-                "age_appropriateness_score",
-                "analytical_depth_reasoning",
-                "analytical_depth_score",
-                "open_endedness_reasoning",
-                "open_endedness_score",
-                "textual_scope_reasoning",
-                "textual_scope_score",
-                "language_complexity_reasoning",
-                "language_complexity_score",
-                "bias_free_reasoning",
-                "bias_free_score",
-                "action_verbs_reasoning",
-                "action_verbs_score",
-                "feasibility_of_answer_reasoning",
-                "feasibility_of_answer_score",
-            ],
+            "properties": criteria_properties(criteria),
+            "required": list(criteria_properties(criteria)),
         },
     }
 
@@ -264,6 +246,8 @@ FRQ: {frq}
         messages_for_openai,
         functions=[add_assessment_openai_function],
         function_name="add_assessment",
+        call_site="assess_frq" if len(criteria) == len(FRQ_CRITERIA) else "screen_frq",
+        model=model,
     )
     print(f"OpenAI response time: {time.time() - start_time}")
     # arguments = json.loads(response["arguments"])
@@ -273,38 +257,260 @@ FRQ: {frq}
     return arguments
 
 
-def select_best_frq(frq_rankings: list[dict]):
-    for frq in frq_rankings:
-        frq["score"] = (
-            frq["feasibility_of_answer_score"] * 2
-            + frq["alignment_score"] * 2
-            + frq["clarity_score"]
-            + frq["age_appropriateness_score"]
-            + frq["analytical_depth_score"]
-            + frq["open_endedness_score"]
-            + frq["textual_scope_score"]
-            + frq["language_complexity_score"]
-            + frq["action_verbs_score"]
-        ) / 11
-    # Remove any frq for which the bias_free_score is less than 5
-    frq_rankings = [
-        frq_ranking
-        for frq_ranking in frq_rankings
-        if frq_ranking["bias_free_score"] >= 5
+async def assess_frqs_batched(frqs, text, model=None, deadline=NO_DEADLINE):
+    """
+    Assesses all FRQs in a single request instead of one request per FRQ, so the text
+    and rubric are only sent once. Returns one assessment per FRQ, in order, in the same
+    format as assess_frq. FRQs the model skipped are assessed individually, within the
+    deadline; those that don't make it are left out.
+    """
+    prompt = f"""
+You are an educational expert who is tasked with assessing the quality of free-response questions (FRQs) that are geared towards assessing how well students have assimilated the CCSS.ELA-Literacy.W.4 common core standard. The standard is:
+
+"Draw evidence from literary or informational texts to support analysis, reflection, and research."
+
+Given a text and a numbered list of FRQs, you assess the quality of each FRQ along the following criteria:
+
+{FRQ_ASSESSMENT_CRITERIA}
+
+
+When you receive a text and the FRQs, you assess the quality of every FRQ along the above criteria, independently of the other FRQs. For each criterium, you write a brief reasoning (no more than two sentences) about your thoughts, containing at least one positive AND one negative aspect.. Then you give a numerical score for that criterium. Finally, you use the function `add_assessments` to save your evaluations of all {len(frqs)} FRQs, one per FRQ, with the number of the FRQ it refers to.
+"""
+
+    numbered_frqs = "\n".join(f"{i + 1}. {frq}" for i, frq in enumerate(frqs))
+    messages_for_openai = [
+        OpenaiChatMessage(role="system", content=prompt),
+        OpenaiChatMessage(
+            role="user",
+            content=f"""
+TEXT: {text}
+
+====================
+
+FRQS:
+{numbered_frqs}
+""",
+        ),
     ]
 
+    add_assessments_openai_function: OpenAifunction = {
+        "name": "add_assessments",
+        "description": "Add an assessment for each of the given FRQs.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "assessments": {
+                    "type": "array",
+                    "description": "One assessment per FRQ.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "frq_number": {
+                                "type": "integer",
+                                "description": "The number of the assessed FRQ in the list.",
+                            },
+                            **FRQ_ASSESSMENT_PROPERTIES,
+                        },
+                        "required": ["frq_number", *FRQ_ASSESSMENT_PROPERTIES],
+                    },
+                },
+            },
+            "required": ["assessments"],
+        },
+    }
 
+    print("Sending to OpenAI")
+    start_time = time.time()
+    arguments = await get_response_openai_nonstream(
+        messages_for_openai,
+        functions=[add_assessments_openai_function],
+        function_name="add_assessments",
+        call_site="assess_frqs_batched",
+        model=model,
+    )
+    print(f"OpenAI response time: {time.time() - start_time}")
+
+    frq_rankings: list[dict | None] = [None] * len(frqs)
+    for assessment in arguments["assessments"]:
+        index = int(assessment.pop("frq_number")) - 1
+        if 0 <= index < len(frqs) and frq_rankings[index] is None:
+            assessment["frq"] = frqs[index]
+            frq_rankings[index] = assessment
+
+    missing = [i for i, frq_ranking in enumerate(frq_rankings) if frq_ranking is None]
+    if missing:
+        print(f"Batched assessment skipped {len(missing)} FRQs, assessing them individually")
+        # Only worth waiting past the deadline if the batch has no eligible FRQ.
+        has_eligible = any(
+            frq_ranking is not None and is_eligible_frq(frq_ranking)
+            for frq_ranking in frq_rankings
+        )
+        for frq_ranking in await gather_within(
+            [assess_frq(frqs[i], text, model) for i in missing],
+            deadline,
+            min_results=0 if has_eligible else 1,
+            usable=None if has_eligible else is_eligible_frq,
+        ):
+            frq_rankings[frqs.index(frq_ranking["frq"])] = frq_ranking
+    return [frq_ranking for frq_ranking in frq_rankings if frq_ranking is not None]
+
+
+def deduplicate_frqs(frqs: list[str]) -> list[str]:
+    """
+    Drops near-duplicate FRQs (e.g. rephrasings of the same question), keeping the
+    first FRQ of each group, so each distinct question is only assessed once.
+    """
+    return [frqs[cluster[0]] for cluster in near_duplicate_clusters(frqs)]
+
+
+# FRQs need a bias-free score of at least this to be selected.
+BIAS_FREE_CUTOFF = 5
+
+
+FRQ_RANKING_POLICY = RankingPolicy(
+    weights={
+        "feasibility_of_answer_score": 2,
+        "alignment_score": 2,
+        "clarity_score": 1,
+        "age_appropriateness_score": 1,
+        "analytical_depth_score": 1,
+        "open_endedness_score": 1,
+        "textual_scope_score": 1,
+        "language_complexity_score": 1,
+        "action_verbs_score": 1,
+    },
+    filters={"bias_free_score": (">=", BIAS_FREE_CUTOFF)},
+)
+
+
+def frq_score(frq_ranking: dict) -> float:
+    return weighted_score(frq_ranking, FRQ_RANKING_POLICY)
+
+
+def is_eligible_frq(frq_ranking: dict) -> bool:
+    return frq_ranking["bias_free_score"] >= BIAS_FREE_CUTOFF
+
+
+def select_best_frq(
+    frq_rankings: list[dict], policy: RankingPolicy = FRQ_RANKING_POLICY
+) -> dict:
+    """Returns (a copy of) the best bias-free FRQ assessment, with its "score"."""
+    return top_k(frq_rankings, policy, k=1)[0]
+
+
+async def rank_frqs_cascade(
+    frqs: list[str],
+    text: str,
+    config: CascadeConfig = STAGE_CASCADES["assess_frq"],
+    deadline: Deadline = NO_DEADLINE,
+) -> list[dict]:
+    # Assess everything with the cheap model first, keeping part of the budget for the
+    # expensive tier.
+    frq_rankings = await gather_within(
+        [assess_frq(frq, text, model=config.cheap_model) for frq in frqs],
+        deadline.portion(0.5),
+        min_results=config.top_k,
+        usable=is_eligible_frq,
+    )
 
-    frq_rankings = sorted(
-        frq_rankings,
-        key=lambda frq_ranking: frq_ranking["score"],
+    by_score = sorted(frq_rankings, key=frq_score, reverse=True)
+    eligible = [frq_ranking for frq_ranking in by_score if is_eligible_frq(frq_ranking)]
+    # Re-assess the best FRQs, plus strong ones the cheap model may have wrongly
+    # filtered in or out, with the expensive model.
+    to_escalate = eligible[: config.top_k] + [
+        frq_ranking
+        for frq_ranking in by_score[: config.top_k]
+        if frq_ranking not in eligible[: config.top_k]
+        and abs(frq_ranking["bias_free_score"] - BIAS_FREE_CUTOFF) <= config.threshold_margin
+    ]
+    escalated: list[dict] = []
+    tried: set[str] = set()
+    for round_number in range(config.max_rounds):
+        if not to_escalate:
+            break
+        # As for sections, only the first round runs regardless of the deadline.
+        if round_number > 0 and deadline.expired():
+            deadline.mark_degraded()
+            break
+        print(f"Escalating {len(to_escalate)}/{len(frqs)} FRQs to {config.expensive_model}")
+        escalated += await gather_within(
+            [
+                assess_frq(frq_ranking["frq"], text, model=config.expensive_model)
+                for frq_ranking in to_escalate
+            ],
+            deadline,
+            usable=is_eligible_frq,
+        )
+        if any(is_eligible_frq(frq_ranking) for frq_ranking in escalated):
+            break
+        # The expensive model filtered out every FRQ so far: try the next ones.
+        tried |= {frq_ranking["frq"] for frq_ranking in to_escalate}
+        to_escalate = [
+            frq_ranking for frq_ranking in by_score if frq_ranking["frq"] not in tried
+        ][: config.top_k]
+    # Cheap-model scores aren't comparable with expensive-model ones, so only the
+    # re-assessed FRQs are candidates.
+    return escalated
+
+
+# The heavily weighted criteria and the hard cutoff, scored first to screen out FRQs.
+GATING_CRITERIA = ["bias_free", "feasibility_of_answer", "alignment"]
+
+
+class SuccessiveHalvingConfig(NamedTuple):
+    # Share of the screened FRQs that get the full rubric.
+    survivor_fraction: float = 0.5
+    min_survivors: int = 2
+    # Model for the full rubric, e.g. a stronger one than used for screening.
+    final_model: str | None = None
+
+
+def gating_score(frq_ranking: dict) -> float:
+    return (
+        frq_ranking["feasibility_of_answer_score"] * 2 + frq_ranking["alignment_score"] * 2
+    ) / 4
+
+
+async def rank_frqs_successive_halving(
+    frqs: list[str],
+    text: str,
+    config: SuccessiveHalvingConfig = SuccessiveHalvingConfig(),
+    deadline: Deadline = NO_DEADLINE,
+) -> list[dict]:
+    """
+    Scores all FRQs on the gating criteria only, then assesses the best of them along
+    the full rubric. Returns the full assessments of the survivors, to be passed to
+    select_best_frq. Screening gets half of the deadline, the full rubric the rest.
+    """
+    screenings = await gather_within(
+        [assess_frq(frq, text, criteria=GATING_CRITERIA) for frq in frqs],
+        deadline.portion(0.5),
+        min_results=config.min_survivors,
+        usable=is_eligible_frq,
+    )
+    # FRQs over the bias-free cutoff first, then by their gating score.
+    by_score = sorted(
+        screenings,
+        key=lambda screening: (is_eligible_frq(screening), gating_score(screening)),
         reverse=True,
     )
+    n_survivors = max(
+        config.min_survivors, math.ceil(config.survivor_fraction * len(screenings))
+    )
+    survivors = by_score[:n_survivors]
+    print(f"{len(survivors)}/{len(frqs)} FRQs survived screening")
+
+    return await gather_within(
+        [
+            assess_frq(survivor["frq"], text, model=config.final_model)
+            for survivor in survivors
+        ],
+        deadline,
+        usable=is_eligible_frq,
+    )
 
-    return frq_rankings[0]
 
 if __name__ == "__main__":
-    import asyncio
     import sys
 
     text = "A baseball uniform is a type of uniform worn by baseball players, and by some non-playing personnel, such as field managers and coaches. It is worn to indicate the person's role in the game and\u2014through the use of logos, colors, and numbers\u2014to identify the teams and their players, managers, and coaches.Traditionally, home uniforms display the team name on the front, while away uniforms display the team's home location. In modern times, however, exceptions to this pattern have become common, with teams using their team name on both uniforms. Most teams also have one or more alternate uniforms, usually consisting of the primary or secondary team color on the vest instead of the usual white or gray. In the past few decades throwback uniforms have become popular.The New York Knickerbockers were the first baseball team to use uniforms, taking the field on April 4, 1849, in pants made of blue wool, white flannel shirts (jerseys) and straw hats. Caps and other types of headgear have been a part of baseball uniforms from the beginning. Baseball teams often wore full-brimmed straw hats or no cap at all since there was no official rule regarding headgear. Under the 1882 uniform rules, players on the same team wore uniforms of different colors and patterns that indicated which position they played. This rule was soon abandoned as impractical.In the late 1880s, Detroit and Washington of the National League and Brooklyn of the American Association were the first to wear striped uniforms. By the end of the 19th century, teams began the practice of having two different uniforms, one for when they played at home in their own baseball stadium and a different one for when they played away (on the road) at the other team's ballpark. It became common to wear white pants with a white color vest at home and gray pants with a gray or solid (dark) colored vest when away. By 1900, both home and away uniforms were standard across the major leagues.In June 2021, MLB announced a long-term deal with cryptocurrency exchange FTX, which includes the FTX logo appearing on umpire uniforms during all games. FTX is MLB's first-ever umpire uniform patch partner. On November 11, 2022, FTX filed for Chapter 11 bankruptcy protection. MLB removed the FTX patches from umpires' uniforms before the 2023 season."
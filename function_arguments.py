@@ -0,0 +1,169 @@
+import json
+import re
+from typing import Any
+
+VALID_ESCAPES = set('"\\/bfnrtu')
+NUMBER_PREFIX = re.compile(r"^\s*(-?\d+(?:\.\d+)?)")
+
+
+class InvalidFunctionArguments(ValueError):
+    pass
+
+
+def _closes_string(arguments: str, quote_index: int) -> bool:
+    """
+    Guesses whether the unescaped quote at `quote_index` ends the current string, or is
+    a quote the model forgot to escape, by looking at what follows it.
+    """
+    rest = arguments[quote_index + 1 :].lstrip()
+    if not rest or rest[0] in "}]:":
+        return True
+    if rest[0] == ",":
+        after_comma = rest[1:].lstrip()
+        return not after_comma or after_comma[0] in '"{[]}-0123456789tfn'
+    return False
+
+
+def _drop_trailing_comma(out: list[str]) -> None:
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(arguments: str) -> str:
+    """
+    Fixes the mistakes models commonly make when writing function arguments: raw
+    newlines and control characters in strings, unescaped quotes, invalid escapes,
+    trailing commas and output truncated before strings/objects are closed.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    in_string = False
+    i = 0
+    while i < len(arguments):
+        char = arguments[i]
+        if in_string:
+            if char == "\\":
+                next_char = arguments[i + 1] if i + 1 < len(arguments) else ""
+                if next_char in VALID_ESCAPES and next_char:
+                    out.append(char + next_char)
+                    i += 2
+                    continue
+                out.append("\\\\")
+            elif char == '"':
+                if _closes_string(arguments, i):
+                    in_string = False
+                    out.append(char)
+                else:
+                    out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            elif char == "\r":
+                out.append("\\r")
+            elif char == "\t":
+                out.append("\\t")
+            elif ord(char) < 0x20:
+                out.append(f"\\u{ord(char):04x}")
+            else:
+                out.append(char)
+        else:
+            if char == '"':
+                in_string = True
+            elif char in "{[":
+                stack.append("}" if char == "{" else "]")
+            elif char in "}]":
+                _drop_trailing_comma(out)
+                if stack:
+                    stack.pop()
+            out.append(char)
+        i += 1
+
+    # Close whatever the model didn't get to before it was cut off.
+    if in_string:
+        if out and out[-1] == "\\":
+            out.pop()
+        out.append('"')
+    _drop_trailing_comma(out)
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ":":
+        out.append("null")
+    while stack:
+        _drop_trailing_comma(out)
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def coerce_and_validate(value: Any, schema: dict, path: str = "arguments") -> Any:
+    """
+    Checks `value` against a (simple) JSON schema, converting values that are
+    unambiguously of the wrong type, e.g. "4" -> 4 for number properties.
+    """
+    schema_type = schema.get("type")
+    types = schema_type if isinstance(schema_type, list) else [schema_type]
+
+    if "object" in types:
+        if not isinstance(value, dict):
+            raise InvalidFunctionArguments(f"{path} should be an object")
+        for name in schema.get("required", []):
+            if value.get(name) is None:
+                raise InvalidFunctionArguments(f"{path} is missing {name}")
+        return {
+            name: coerce_and_validate(
+                property_value,
+                schema.get("properties", {}).get(name, {}),
+                f"{path}.{name}",
+            )
+            for name, property_value in value.items()
+        }
+    if "array" in types:
+        if not isinstance(value, list):
+            raise InvalidFunctionArguments(f"{path} should be an array")
+        return [
+            coerce_and_validate(item, schema.get("items", {}), f"{path}[{i}]")
+            for i, item in enumerate(value)
+        ]
+    if "number" in types or "integer" in types:
+        if isinstance(value, bool):
+            raise InvalidFunctionArguments(f"{path} should be a number")
+        if isinstance(value, (int, float)):
+            return value
+        match = NUMBER_PREFIX.match(str(value))
+        if match is None:
+            raise InvalidFunctionArguments(f"{path} should be a number, got {value!r}")
+        number = float(match.group(1))
+        return int(number) if number.is_integer() else number
+    if "boolean" in types:
+        if isinstance(value, bool):
+            return value
+        if str(value).strip().lower() in ("true", "false"):
+            return str(value).strip().lower() == "true"
+        raise InvalidFunctionArguments(f"{path} should be a boolean, got {value!r}")
+    if "string" in types:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)):
+            return str(value)
+        raise InvalidFunctionArguments(f"{path} should be a string")
+    return value
+
+
+def parse_function_arguments(arguments: str, parameters_schema: dict) -> dict:
+    """
+    Parses the arguments of a function call, repairing the json if needed, and
+    validates them against the function's parameter schema.
+
+    Raises:
+        InvalidFunctionArguments: If the arguments can't be repaired into a valid call.
+    """
+    try:
+        parsed = json.loads(arguments)
+    except json.JSONDecodeError:
+        try:
+            parsed = json.loads(repair_json(arguments))
+        except json.JSONDecodeError as json_error:
+            raise InvalidFunctionArguments(
+                f"Could not repair function arguments: {str(json_error)}"
+            ) from json_error
+    return coerce_and_validate(parsed, parameters_schema)
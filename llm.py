@@ -1,11 +1,33 @@
 
 import asyncio
+import collections
+import concurrent.futures
+import copy
+import hashlib
 import json
 import logging
-from typing import AsyncGenerator, Literal, TypedDict, overload
+import os
+import random
+import threading
+import time
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Literal,
+    NamedTuple,
+    TypedDict,
+    overload,
+)
 
+import aiohttp
 import openai
 
+from function_arguments import InvalidFunctionArguments, parse_function_arguments
+from llm_cache import ResponseCache
+from llm_transport import make_transport
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 logger.addHandler(logging.StreamHandler())
@@ -16,6 +38,10 @@ logger.addHandler(logging.StreamHandler())
 # "model": "gpt-3.5-turbo-0613",
 MODEL = "gpt-4-0613"
 
+JSON_REMINDER = "\n\n Remember to ONLY use valid json when calling functions!!! This means escaping newlines and double quotes!!!"
+# Requests are only re-sent when the arguments can't be repaired locally.
+MAX_PARSE_ATTEMPTS = 3
+
 class FunctionCallResponse(TypedDict):
     name: str
     arguments: str
@@ -43,12 +69,514 @@ class OpenAifunction(TypedDict):
     parameters: ParametersDict
 
 
+class RateLimit(NamedTuple):
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+# Per-model quotas used by the client-side token buckets. Keep these a bit below the
+# limits of the account so that we throttle ourselves before OpenAI does.
+MODEL_RATE_LIMITS: dict[str, RateLimit] = {
+    "gpt-4-0613": RateLimit(requests_per_minute=180, tokens_per_minute=36_000),
+    "gpt-3.5-turbo-0613": RateLimit(requests_per_minute=3_000, tokens_per_minute=80_000),
+}
+DEFAULT_RATE_LIMIT = RateLimit(requests_per_minute=180, tokens_per_minute=36_000)
+
+
+class CascadeConfig(NamedTuple):
+    """
+    Two-tier scoring: every candidate is scored by `cheap_model`, then the `top_k`
+    candidates plus those whose gating score is within `threshold_margin` of its cutoff
+    are re-scored by `expensive_model`. If the expensive model filters all of them out,
+    the next `top_k` are tried, for at most `max_rounds` rounds in total.
+    """
+
+    cheap_model: str = "gpt-3.5-turbo-0613"
+    expensive_model: str = "gpt-4-0613"
+    top_k: int = 3
+    threshold_margin: float = 1.0
+    max_rounds: int = 3
+
+
+# Per-stage cascade configuration, keyed by call-site.
+STAGE_CASCADES: dict[str, CascadeConfig] = {
+    "rank_section": CascadeConfig(top_k=3, threshold_margin=1.0),
+    "assess_frq": CascadeConfig(top_k=2, threshold_margin=1.0),
+}
+
+MAX_CONCURRENT_REQUESTS = 16
+MAX_RETRIES = 8
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket. Callers reserve capacity up front (the level can go
+    negative) and are told how long to wait before their reservation is covered, so
+    concurrent callers queue up fairly instead of all waking up at the same time.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.level = capacity
+        self.updated_at = time.monotonic()
+        # Streamlit runs every session in its own thread with its own event loop.
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(
+            self.capacity, self.level + (now - self.updated_at) * self.refill_per_second
+        )
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes `amount` out of the bucket and returns the number of seconds to wait."""
+        with self._lock:
+            self._refill()
+            # A single request larger than the bucket would otherwise wait forever.
+            self.level -= min(amount, self.capacity)
+            if self.level >= 0:
+                return 0.0
+            return -self.level / self.refill_per_second
+
+    def adjust(self, amount: float) -> None:
+        """Corrects an earlier reservation once the real cost is known."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+class ModelLimiter:
+    def __init__(self, limit: RateLimit):
+        self.requests = TokenBucket(
+            limit.requests_per_minute, limit.requests_per_minute / 60
+        )
+        self.tokens = TokenBucket(limit.tokens_per_minute, limit.tokens_per_minute / 60)
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        wait = max(
+            self.requests.reserve(1), self.tokens.reserve(estimated_tokens)
+        )
+        if wait > 0:
+            logger.info(f"Rate limiter: waiting {wait:.2f}s before sending request")
+            await asyncio.sleep(wait)
+
+
+def estimate_tokens(args: dict) -> int:
+    # Roughly 4 characters per token for English text; good enough for throttling.
+    prompt_chars = len(json.dumps(args.get("messages", []))) + len(
+        json.dumps(args.get("functions", []))
+    )
+    return prompt_chars // 4 + args.get("max_tokens", 1_000)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    if isinstance(
+        error,
+        (
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+            openai.error.APIConnectionError,
+        ),
+    ):
+        return True
+    if isinstance(error, openai.error.OpenAIError) and (error.http_status or 0) >= 500:
+        return True
+    return "Overload" in str(error) or "RateLimit" in str(error)
+
+
+def get_retry_after(error: Exception) -> float | None:
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class LatencyTracker:
+    """Sliding window of recent successful request latencies for one call-site."""
+
+    def __init__(self, window: int = 200):
+        self._latencies: collections.deque[float] = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def percentile(self, q: float, min_samples: int) -> float | None:
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgingPolicy(NamedTuple):
+    """
+    If a request hasn't returned after the `percentile` latency of its call-site, send
+    a duplicate and keep whichever finishes first. At most `max_hedge_rate` of all
+    requests get hedged.
+    """
+
+    enabled: bool = False
+    percentile: float = 0.95
+    min_samples: int = 20
+    max_hedge_rate: float = 0.1
+
+
+HEDGING = HedgingPolicy(enabled=os.environ.get("LLM_HEDGING", "") != "")
+
+
+class LLMClient:
+    """
+    Shared entry point for all OpenAI requests. Reuses one HTTP connection pool per
+    event loop, caps the number of requests in flight, throttles each model with
+    token buckets and retries transient errors with exponential backoff + jitter.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_requests: int = MAX_CONCURRENT_REQUESTS,
+        rate_limits: dict[str, RateLimit] = MODEL_RATE_LIMITS,
+        max_retries: int = MAX_RETRIES,
+        transport=None,
+        hedging: HedgingPolicy = HEDGING,
+    ):
+        # Live OpenAI by default; see llm_transport for record/replay.
+        self.transport = transport if transport is not None else make_transport()
+        self.max_concurrent_requests = max_concurrent_requests
+        self.rate_limits = rate_limits
+        self.max_retries = max_retries
+        self.hedging = hedging
+        self._latency_trackers: collections.defaultdict[str, LatencyTracker] = (
+            collections.defaultdict(LatencyTracker)
+        )
+        self._hedge_counts_lock = threading.Lock()
+        self._requests_sent = 0
+        self._hedges_sent = 0
+        self._limiters: dict[str, ModelLimiter] = {}
+        self._limiters_lock = threading.Lock()
+        # aiohttp sessions and asyncio semaphores are bound to the loop they are used on.
+        # They keep their loop alive, so loops are forgotten explicitly once closed.
+        self._sessions: dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._semaphores: dict[asyncio.AbstractEventLoop, asyncio.BoundedSemaphore] = {}
+        self._session_closers: dict[asyncio.AbstractEventLoop, AsyncGenerator[None, None]] = {}
+        self._loops_lock = threading.Lock()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._limiters_lock:
+            if model not in self._limiters:
+                self._limiters[model] = ModelLimiter(
+                    self.rate_limits.get(model, DEFAULT_RATE_LIMIT)
+                )
+            return self._limiters[model]
+
+    async def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        self._forget_closed_loops()
+        with self._loops_lock:
+            session = self._sessions.get(loop)
+            if session is not None and not session.closed:
+                return session
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_concurrent_requests, keepalive_timeout=60
+                )
+            )
+            self._sessions[loop] = session
+            closer = self._close_on_shutdown(loop, session)
+            self._session_closers[loop] = closer
+        # Runs up to its `yield`, registering it with the loop's async generators.
+        await closer.__anext__()
+        return session
+
+    async def _close_on_shutdown(
+        self, loop: asyncio.AbstractEventLoop, session: aiohttp.ClientSession
+    ) -> AsyncGenerator[None, None]:
+        """
+        Closes `session` when its loop shuts down its async generators, which asyncio.run
+        does before closing the loop.
+        """
+        try:
+            yield
+        finally:
+            self._forget_loop(loop, session)
+            await session.close()
+
+    def _forget_loop(
+        self, loop: asyncio.AbstractEventLoop, session: aiohttp.ClientSession
+    ) -> None:
+        with self._loops_lock:
+            if self._sessions.get(loop) is session:
+                del self._sessions[loop]
+                self._session_closers.pop(loop, None)
+                self._semaphores.pop(loop, None)
+
+    def _forget_closed_loops(self) -> None:
+        with self._loops_lock:
+            closed_loops = {
+                loop for loop in [*self._sessions, *self._semaphores] if loop.is_closed()
+            }
+            for loop in closed_loops:
+                session = self._sessions.pop(loop, None)
+                self._session_closers.pop(loop, None)
+                self._semaphores.pop(loop, None)
+                if session is not None and not session.closed:
+                    logger.warning(
+                        "Event loop closed without shutting down its async generators,"
+                        " its HTTP session could not be closed"
+                    )
+
+    def semaphore(self) -> asyncio.BoundedSemaphore:
+        loop = asyncio.get_running_loop()
+        with self._loops_lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.BoundedSemaphore(
+                    self.max_concurrent_requests
+                )
+            return self._semaphores[loop]
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._loops_lock:
+            session = self._sessions.get(loop)
+        if session is not None:
+            self._forget_loop(loop, session)
+            await session.close()
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        delay = random.uniform(
+            0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2**attempt)
+        )
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def create(self, call_site: str | None = None, **args: Any) -> Any:
+        """
+        Drop-in replacement for `openai.ChatCompletion.acreate`. `call_site` groups
+        requests whose latencies are comparable, for hedging.
+        """
+        call_site = call_site or args.get("function_call", {}).get("name", "completion")
+        tracker = self._latency_trackers[call_site]
+        with self._hedge_counts_lock:
+            self._requests_sent += 1
+
+        hedge_after = None
+        if self.hedging.enabled and not args.get("stream"):
+            hedge_after = tracker.percentile(
+                self.hedging.percentile, self.hedging.min_samples
+            )
+        if hedge_after is None:
+            return await self._create_with_retries(args, tracker)
+        return await self._create_hedged(args, call_site, tracker, hedge_after)
+
+    def _take_hedge_budget(self) -> bool:
+        with self._hedge_counts_lock:
+            if self._hedges_sent + 1 > self.hedging.max_hedge_rate * self._requests_sent:
+                return False
+            self._hedges_sent += 1
+            return True
+
+    async def _create_hedged(
+        self, args: dict, call_site: str, tracker: LatencyTracker, hedge_after: float
+    ) -> Any:
+        sent = asyncio.Event()
+        primary = asyncio.ensure_future(self._create_with_retries(args, tracker, sent))
+        sent_waiter: asyncio.Future | None = None
+        hedge: asyncio.Future | None = None
+        # Whatever happens, including the caller being cancelled, nothing is left running.
+        try:
+            # Time spent queueing in the limiter doesn't count: a hedge wouldn't be faster.
+            sent_waiter = asyncio.ensure_future(sent.wait())
+            await asyncio.wait({primary, sent_waiter}, return_when=asyncio.FIRST_COMPLETED)
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done or not self._take_hedge_budget():
+                return await primary
+
+            logger.info(
+                f"Hedging {call_site} request after {hedge_after:.2f}s without a response"
+            )
+            hedge = asyncio.ensure_future(self._create_with_retries(args, tracker))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                # If one copy failed, keep waiting on the other one.
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in (primary, hedge, sent_waiter):
+                if task is not None:
+                    task.cancel()
+
+    async def _create_with_retries(
+        self,
+        args: dict,
+        tracker: LatencyTracker | None = None,
+        sent: asyncio.Event | None = None,
+    ) -> Any:
+        estimated_tokens = estimate_tokens(args)
+        limiter = self.limiter(args["model"])
+        attempt = 0
+        while True:
+            await limiter.acquire(estimated_tokens)
+            try:
+                async with self.semaphore():
+                    openai.aiosession.set(await self.session())
+                    if sent is not None:
+                        sent.set()
+                    start_time = time.monotonic()
+                    response = await self.transport.create(**args)
+                    if tracker is not None:
+                        tracker.record(time.monotonic() - start_time)
+            except Exception as openai_exception:
+                if not is_retryable_error(openai_exception) or attempt >= self.max_retries:
+                    raise openai_exception
+                delay = self.backoff_delay(attempt, openai_exception)
+                logger.warning(
+                    f"Transient error from OpenAI ({str(openai_exception)}), retrying in {delay:.2f}s"
+                )
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            if not args.get("stream"):
+                usage = response.get("usage") or {}
+                if "total_tokens" in usage:
+                    limiter.tokens.adjust(usage["total_tokens"] - estimated_tokens)
+            return response
+
+
+client = LLMClient()
+
+
+class LeaderCancelled(Exception):
+    pass
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight requests: the first caller for a key does the work and
+    every later caller awaits its result instead of sending a duplicate. Futures are
+    `concurrent.futures.Future`s so that callers on other threads' event loops (one per
+    Streamlit session) can join them too.
+    """
+
+    def __init__(self):
+        self._in_flight: dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            with self._lock:
+                future = self._in_flight.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = concurrent.futures.Future()
+                    # Marks the future as running, so a cancelled follower can't cancel it.
+                    future.set_running_or_notify_cancel()
+                    self._in_flight[key] = future
+
+            if is_leader:
+                return await self._lead(key, future, work)
+
+            logger.info(f"Joining in-flight request {key[:12]}")
+            try:
+                result = await asyncio.wrap_future(future)
+            except LeaderCancelled:
+                # The caller doing the work went away; retry, possibly as the new leader.
+                continue
+            # Callers are free to mutate what they get back.
+            return copy.deepcopy(result)
+
+    async def _lead(
+        self, key: str, future: concurrent.futures.Future, work: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        try:
+            result = await work()
+        except BaseException as error:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(
+                LeaderCancelled() if isinstance(error, asyncio.CancelledError) else error
+            )
+            raise
+        with self._lock:
+            del self._in_flight[key]
+        future.set_result(copy.deepcopy(result))
+        return result
+
+
+single_flight = SingleFlight()
+
+CACHE_ENABLED = os.environ.get("LLM_CACHE_DISABLED", "") == ""
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache()
+    return _response_cache
+
+
+def request_key(
+    model: str,
+    messages: list[OpenaiChatMessage],
+    functions: list[OpenAifunction] | None,
+    function_name: str | None,
+    sample: int = 0,
+) -> str:
+    """
+    Content hash identifying a request. `sample` distinguishes deliberately repeated
+    requests (e.g. an ensemble of feedbacks) so they don't all resolve to one response.
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "functions": functions,
+            "function_name": function_name,
+            "sample": sample,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 async def get_response_openai(
     messages: list[OpenaiChatMessage],
+    model: str | None = None,
+    use_cache: bool = True,
 ) -> AsyncGenerator[str, None]:
+    # Shares cache entries with the non-streaming version for the same request.
+    model = model or openai.MODEL
+    use_cache = use_cache and CACHE_ENABLED
+    key = request_key(model, messages, None, None)
+    if use_cache:
+        cached = get_response_cache().get(key)
+        if cached is not None:
+            logger.info(f"Cache hit for request {key[:12]}")
+            yield cached
+            return
+
     try:
-        response = await openai.ChatCompletion.acreate(
-            model="gpt-4-0613",
+        response = await client.create(
+            model=model,
             n=1,
             top_p=1,
             frequency_penalty=0,
@@ -62,23 +590,46 @@ async def get_response_openai(
         )
         raise openai_exception
         
+    content = []
     try:
         async for chunk in response:
             # logger.debug(f"Chunk: {chunk}")
             choices = chunk["choices"]
             if len(choices) > 1:
                 logger.warning(f"More than one choice returned??: {choices}")
-            current_content = choices[0]["delta"].get("content", "")
+            current_content = choices[0]["delta"].get("content") or ""
             logger.debug(f"Current content: {current_content}")
+            content.append(current_content)
             yield current_content
     except Exception as e:
         logger.error(f"Error in streaming response: {str(e)}")
         raise e
+    if use_cache:
+        get_response_cache().set(key, "".join(content))
+
+
+async def get_streamed_response(
+    messages: list[OpenaiChatMessage],
+    on_token: Callable[[str], None],
+    model: str | None = None,
+) -> str:
+    """Streams a completion, passing each token to `on_token`, and returns the full text."""
+    tokens = []
+    async for token in get_response_openai(messages, model=model):
+        tokens.append(token)
+        on_token(token)
+    return "".join(tokens)
 
 
 @overload
 async def get_response_openai_nonstream(
-    messages: list[OpenaiChatMessage], functions: list[OpenAifunction], function_name: str
+    messages: list[OpenaiChatMessage],
+    functions: list[OpenAifunction],
+    function_name: str,
+    sample: int = 0,
+    use_cache: bool = True,
+    call_site: str | None = None,
+    model: str | None = None,
 ) -> FunctionCallResponse:
     ...
 
@@ -88,6 +639,10 @@ async def get_response_openai_nonstream(
     messages: list[OpenaiChatMessage],
     functions: None = None,
     function_name: None = None,
+    sample: int = 0,
+    use_cache: bool = True,
+    call_site: str | None = None,
+    model: str | None = None,
 ) -> str:
     ...
 
@@ -97,62 +652,98 @@ async def get_response_openai_nonstream(
     messages: list[OpenaiChatMessage],
     functions: list[OpenAifunction] | None = None,
     function_name: str|None = None,
-    # model: str = MODEL,
+    sample: int = 0,
+    use_cache: bool = True,
+    call_site: str | None = None,
+    model: str | None = None,
+) -> str | FunctionCallResponse:
+    # Defaults to the model picked in the sidebar.
+    model = model or openai.MODEL
+    use_cache = use_cache and CACHE_ENABLED
+    key = request_key(model, messages, functions, function_name, sample)
+    if use_cache:
+        cached = get_response_cache().get(key)
+        if cached is not None:
+            logger.info(f"Cache hit for request {key[:12]}")
+            return cached
+
+    async def send_request() -> str | FunctionCallResponse:
+        response = await _request_openai_nonstream(
+            messages, functions, function_name, call_site, model
+        )
+        if use_cache:
+            get_response_cache().set(key, response)
+        return response
+
+    return await single_flight.do(key, send_request)
+
+
+async def _request_openai_nonstream(
+    messages: list[OpenaiChatMessage],
+    functions: list[OpenAifunction] | None = None,
+    function_name: str|None = None,
+    call_site: str | None = None,
+    model: str = MODEL,
 ) -> str | FunctionCallResponse:
-    while True:
+    if functions is not None:
+        # Remind the model to only retur valid json..... Built once, so retries don't
+        # keep growing the prompt, and without touching the caller's messages.
+        messages = [
+            OpenaiChatMessage(
+                role=messages[0]["role"],
+                content=messages[0]["content"] + JSON_REMINDER,
+            ),
+            *messages[1:],
+        ]
+    args = {
+        "model": model,
+        "n": 1,
+        "top_p": 1,
+        "frequency_penalty": 0,
+        "presence_penalty": 0,
+        "messages": messages,
+    }
+    if functions is not None:
+        args["functions"] = functions
+    if function_name is not None:
+        args["function_call"] = {
+            "name": function_name,
+        }
+
+    for attempt in range(MAX_PARSE_ATTEMPTS):
+        logger.info(f"Sending request to OpenAI with model {model}")
         try:
-            args = {
-                    "model" : openai.MODEL,
-                # "model": "gpt-4-0613",
-                # "model": "gpt-3.5-turbo-0613",
-                "n": 1,
-                "top_p": 1,
-                "frequency_penalty": 0,
-                "presence_penalty": 0,
-                "messages": messages,
-            }
-            if functions is not None:
-                args["functions"] = functions
-                # Remind the model to only retur valid json.....
-                messages[0]["content"] = messages[0]["content"] + "\n\n Remember to ONLY use valid json when calling functions!!! This means escaping newlines and double quotes!!!"
-            if function_name is not None:
-                args["function_call"] = {
-                    "name": function_name,
-                }
-            logger.info(f"Sending request to OpenAI with model {openai.MODEL}")
-            response = await openai.ChatCompletion.acreate(**args)
-            logger.info("Got response from OpenAI")
-            choices = response["choices"]
-            if len(choices) > 1:
-                logger.warning(f"More than one choice returned??: {choices}")
-            if functions is not None:
-                function_call = choices[0]["message"].get("function_call", "")
-                if not function_call:
-                    logger.warning(f"No function call returned??: {function_call}")
-                # logger.debug(f"Function call: {function_call}")
-                arguments = function_call.get("arguments", "")
-                if not arguments:
-                    logger.warning(f"No arguments returned??: {arguments}")
-                arguments_parsed = json.loads(arguments.replace("\n\n", "\\n \\n"))
-                return arguments_parsed
-            current_content = choices[0]["message"].get("content", "")
-            # logger.debug(f"Current content: {current_content}")
-            return current_content
-        except json.JSONDecodeError as json_error:
-            logger.warning(f"JSON error, retrying: {str(json_error)}")
-            # wait a bit and try again
+            response = await client.create(call_site=call_site, **args)
         except Exception as openai_exception:
-            if "Overload" in str(openai_exception) or "RateLimit" in str(openai_exception):
-                logger.warning("Overload error, retrying")
-                # wait a bit and try again
-                await asyncio.sleep(1)
-            else:
-                logger.error(
-                    f"Error in creating campaigns from openAI: {str(openai_exception)}"
-                )
-                raise openai_exception
-            
-    # try:
-    # except Exception as e:
-    #     logger.error(f"Error in streaming response: {str(e)}")
-    #     raise e
+            # Transient errors (overload, rate limits) are already retried by the client.
+            logger.error(
+                f"Error in creating campaigns from openAI: {str(openai_exception)}"
+            )
+            raise openai_exception
+        logger.info("Got response from OpenAI")
+        choices = response["choices"]
+        if len(choices) > 1:
+            logger.warning(f"More than one choice returned??: {choices}")
+        if functions is None:
+            return choices[0]["message"].get("content", "")
+
+        function_call = choices[0]["message"].get("function_call") or {}
+        if not function_call:
+            logger.warning(f"No function call returned??: {function_call}")
+        arguments = function_call.get("arguments", "")
+        if not arguments:
+            logger.warning(f"No arguments returned??: {arguments}")
+        function = next(
+            (f for f in functions if f["name"] == function_call.get("name", function_name)),
+            functions[0],
+        )
+        try:
+            return parse_function_arguments(arguments, function["parameters"])
+        except InvalidFunctionArguments as parse_error:
+            # Only worth another round trip if the arguments couldn't be repaired.
+            logger.warning(
+                f"Invalid function arguments (attempt {attempt + 1}), retrying: {str(parse_error)}"
+            )
+    raise InvalidFunctionArguments(
+        f"No valid {function_name} call after {MAX_PARSE_ATTEMPTS} attempts"
+    )
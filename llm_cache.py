@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any
+
+from sqlite_store import SQLiteStore
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+# Bounds after which the least recently used entries are evicted.
+MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 50_000))
+MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+# Entries older than this many seconds are ignored and purged. Empty = never expire.
+TTL_SECONDS = (
+    float(os.environ["LLM_CACHE_TTL_SECONDS"])
+    if os.environ.get("LLM_CACHE_TTL_SECONDS")
+    else None
+)
+
+
+class ResponseCache(SQLiteStore):
+    """
+    Content-addressed store of LLM responses, keyed by llm.request_key, so a request
+    that was already answered costs neither tokens nor latency. Values are stored as
+    JSON and evicted in least-recently-used order once the entry count or total size
+    bound is hit, or dropped once older than the TTL.
+    """
+
+    schema = (
+        """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)",
+    )
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        max_entries: int = MAX_ENTRIES,
+        max_bytes: int = MAX_BYTES,
+        ttl_seconds: float | None = TTL_SECONDS,
+    ):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+    def _is_expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Any | None:
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self._is_expired(created_at, now):
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        serialized = json.dumps(value)
+        now = time.time()
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, len(serialized), now, now),
+            )
+            self._evict(connection, now)
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds is not None:
+            connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+        count, total_size = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+        # Walk from least to most recently used until we are back under both bounds.
+        to_delete = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall():
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            count -= 1
+            total_size -= size
+        logger.info(f"Evicting {len(to_delete)} entries from the LLM response cache")
+        connection.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+
+    def clear(self) -> None:
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM responses")
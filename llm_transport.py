@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, AsyncGenerator, Literal
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+TransportMode = Literal["live", "record", "replay"]
+
+TRANSPORT_MODE: TransportMode = os.environ.get("LLM_TRANSPORT", "live")  # type: ignore
+TRANSPORT_PATH = os.environ.get("LLM_TRANSPORT_PATH", "requests.jsonl")
+# When replaying, sleep for as long as the recorded request originally took.
+REPLAY_LATENCY = os.environ.get("LLM_REPLAY_LATENCY", "") != ""
+
+
+def transport_key(args: dict) -> str:
+    return hashlib.sha256(json.dumps(args, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LiveTransport:
+    async def create(self, **args: Any) -> Any:
+        return await openai.ChatCompletion.acreate(**args)
+
+
+class RecordingTransport:
+    """
+    Sends requests to OpenAI and appends every request/response pair, with its latency,
+    as one JSON line to `path`. Streaming responses are stored as the list of chunks
+    together with the offset at which each chunk arrived.
+    """
+
+    def __init__(self, path: str = TRANSPORT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _write(self, record: dict) -> None:
+        line = json.dumps(record)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+    async def create(self, **args: Any) -> Any:
+        start_time = time.monotonic()
+        response = await openai.ChatCompletion.acreate(**args)
+        if args.get("stream"):
+            return self._record_stream(args, response, start_time)
+
+        self._write(
+            {
+                "key": transport_key(args),
+                "request": args,
+                "response": response,
+                "latency": time.monotonic() - start_time,
+                "recorded_at": time.time(),
+            }
+        )
+        return response
+
+    async def _record_stream(
+        self, args: dict, response: AsyncGenerator, start_time: float
+    ) -> AsyncGenerator:
+        chunks = []
+        async for chunk in response:
+            chunks.append({"offset": time.monotonic() - start_time, "chunk": chunk})
+            yield chunk
+        self._write(
+            {
+                "key": transport_key(args),
+                "request": args,
+                "chunks": chunks,
+                "latency": time.monotonic() - start_time,
+                "recorded_at": time.time(),
+            }
+        )
+
+
+class ReplayTransport:
+    """
+    Serves responses recorded by `RecordingTransport` without touching the network.
+    Identical requests recorded several times are served in recording order (wrapping
+    around), so replays are deterministic.
+    """
+
+    def __init__(self, path: str = TRANSPORT_PATH, replay_latency: bool = REPLAY_LATENCY):
+        self.path = path
+        self.replay_latency = replay_latency
+        self._records: dict[str, list[dict]] = defaultdict(list)
+        self._served: dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                # Skip lines that aren't recordings (e.g. other jsonl content).
+                if "key" in record and "request" in record:
+                    self._records[record["key"]].append(record)
+        logger.info(
+            f"Loaded {sum(len(r) for r in self._records.values())} recorded requests from {path}"
+        )
+
+    def _next_record(self, args: dict) -> dict:
+        key = transport_key(args)
+        with self._lock:
+            records = self._records.get(key)
+            if not records:
+                raise KeyError(f"No recorded response for request {key[:12]} in {self.path}")
+            record = records[self._served[key] % len(records)]
+            self._served[key] += 1
+        return record
+
+    async def create(self, **args: Any) -> Any:
+        record = self._next_record(args)
+        if args.get("stream"):
+            return self._replay_stream(record)
+        if self.replay_latency:
+            await asyncio.sleep(record["latency"])
+        return record["response"]
+
+    async def _replay_stream(self, record: dict) -> AsyncGenerator:
+        elapsed = 0.0
+        for chunk in record["chunks"]:
+            if self.replay_latency:
+                await asyncio.sleep(chunk["offset"] - elapsed)
+                elapsed = chunk["offset"]
+            yield chunk["chunk"]
+
+
+def make_transport(mode: TransportMode = TRANSPORT_MODE, path: str = TRANSPORT_PATH):
+    if mode == "record":
+        return RecordingTransport(path)
+    if mode == "replay":
+        return ReplayTransport(path)
+    return LiveTransport()
@@ -0,0 +1,369 @@
+"""
+Offline, rule-based checks of the mechanics of a student answer (spelling,
+capitalization, punctuation, repeated words and run-on sentences), graded and
+presented like an individual LLM feedback on the "Mechanical Accuracy" parameter.
+"""
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable
+
+# One lowercase word per line; inflections are handled by `is_known_word`.
+WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mechanics_words.txt")
+
+WORD_PATTERN = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+SENTENCE_END_PATTERN = re.compile(r"[.!?]+(?=\s|$)")
+# The word before a period, with the inner periods of abbreviations like "U.S" or "e.g".
+WORD_BEFORE_PERIOD = re.compile(r"[A-Za-z](?:[A-Za-z.]*[A-Za-z])?$")
+SPACE_BEFORE_PUNCTUATION = re.compile(r"\w\s+[,.;:!?]")
+MISSING_SPACE_AFTER_COMMA = re.compile(r"[,;:][A-Za-z]")
+MISSING_SPACE_AFTER_PERIOD = re.compile(r"[a-z0-9][.!?][A-Za-z]{2}")
+REPEATED_PUNCTUATION = re.compile(r"([,;:])\1+|[!?]{2,}")
+
+SUFFIXES = ["'s", "s", "es", "ed", "d", "ing", "ly", "er", "est", "ers", "ness", "ment", "ful"]
+CONTRACTION_ENDINGS = ["n't", "'re", "'ll", "'ve", "'d", "'m"]
+# Words that are fine twice in a row ("had had", "that that").
+REPEATABLE_WORDS = frozenset({"had", "that"})
+COORDINATING_CONJUNCTIONS = frozenset({"and", "but", "so", "then", "or"})
+# Abbreviations that are always followed by more of the sentence (often a name).
+NON_FINAL_ABBREVIATIONS = frozenset(
+    {"mr", "mrs", "ms", "dr", "prof", "st", "mt", "gen", "gov", "sen", "rep", "capt", "col", "lt", "sgt", "rev", "e.g", "i.e", "vs"}
+)
+# Abbreviations that end a sentence only when a capitalized word follows, like acronyms
+# spelled with periods ("U.S.").
+ABBREVIATIONS = frozenset({"etc", "jr", "sr", "inc", "ltd", "co", "approx"})
+# Parts of a compound word ("sunlight") need at least this many letters.
+MIN_COMPOUND_PART = 3
+# Sentences longer than this, or chaining this many conjunctions, read as run-ons.
+RUN_ON_WORDS = 40
+RUN_ON_CONJUNCTIONS = 4
+# Heuristic flags (spelling against a limited word list, run-on sentences) left out of
+# the grade, so that one or two false positives don't decide it.
+UNCERTAIN_ALLOWANCE = 2
+# Examples listed per kind of issue in the feedback.
+MAX_EXAMPLES = 3
+EXCERPT_WIDTH = 20
+
+# Issues per 100 words up to which each grade is given, best first.
+GRADE_THRESHOLDS = [(1.0, 5), (3.0, 4), (6.0, 3), (10.0, 2)]
+# Spelling and capitalization slips are weighted lower than structural problems.
+ISSUE_WEIGHTS = {
+    "spelling": 1.0,
+    "capitalization": 0.75,
+    "punctuation": 0.75,
+    "repeated word": 1.0,
+    "run-on sentence": 1.5,
+}
+ISSUE_TITLES = {
+    "spelling": "Spelling",
+    "capitalization": "Capital letters",
+    "punctuation": "Punctuation",
+    "repeated word": "Repeated words",
+    "run-on sentence": "Run-on sentences",
+}
+SUMMARIES = {
+    5: "Your writing is very clean, with almost no spelling, capitalization or punctuation mistakes. Great job!",
+    4: "Your writing is mostly clean, and fixing a few small mistakes will make it even easier to read.",
+    3: "You make some spelling and punctuation mistakes that you can fix by carefully reading your answer again.",
+    2: "Several mistakes in spelling, capitalization and punctuation make your answer harder to read, but you can fix them!",
+    1: "Many mechanical mistakes make your answer hard to follow, so take your time to check every sentence.",
+}
+
+
+@dataclass
+class MechanicalIssue:
+    kind: str
+    # The offending text, and a bit of the answer around it.
+    found: str
+    excerpt: str
+    suggestion: str | None = None
+    # Whether the flag comes from a rule that can't misfire, or from a heuristic.
+    certain: bool = True
+
+
+@lru_cache(maxsize=None)
+def load_words(path: str = WORDS_PATH) -> frozenset[str]:
+    with open(path) as f:
+        return frozenset(line.strip() for line in f if line.strip())
+
+
+def is_known_word(word: str, vocabulary: frozenset[str], compounds: bool = True) -> bool:
+    word = word.lower().replace("’", "'")
+    if word in vocabulary:
+        return True
+    for ending in CONTRACTION_ENDINGS:
+        if word.endswith(ending) and word[: -len(ending)] in vocabulary:
+            return True
+    for suffix in SUFFIXES:
+        if not word.endswith(suffix) or len(word) - len(suffix) < 2:
+            continue
+        stem = word[: -len(suffix)]
+        candidates = [stem, stem + "e"]
+        if stem.endswith("i"):
+            # studies -> study, happily -> happy
+            candidates.append(stem[:-1] + "y")
+        if len(stem) > 2 and stem[-1] == stem[-2]:
+            # stopped -> stop
+            candidates.append(stem[:-1])
+        if any(candidate in vocabulary for candidate in candidates):
+            return True
+    # Compounds of two known words ("sunlight", "outfielders").
+    return compounds and any(
+        word[:i] in vocabulary and is_known_word(word[i:], vocabulary, compounds=False)
+        for i in range(MIN_COMPOUND_PART, len(word) - MIN_COMPOUND_PART + 1)
+    )
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment) distance, capped at limit + 1."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous: list[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (a[i - 1] != b[j - 1]),
+            )
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def is_transposition(a: str, b: str) -> bool:
+    if len(a) != len(b):
+        return False
+    differences = [i for i in range(len(a)) if a[i] != b[i]]
+    return (
+        len(differences) == 2
+        and differences[1] == differences[0] + 1
+        and a[differences[0]] == b[differences[1]]
+        and a[differences[1]] == b[differences[0]]
+    )
+
+
+def suggest_spelling(word: str, vocabulary: frozenset[str]) -> str | None:
+    """
+    The correction of `word`, if the vocabulary has a single clear candidate for it to be
+    a misspelling of. Words missing from the list are otherwise taken to be unknown
+    rather than wrong.
+    """
+    word = word.lower()
+    limit = 1 if len(word) <= 8 else 2
+    ranked = []
+    for candidate in vocabulary:
+        # Misspellings rarely get the first letter wrong.
+        if candidate[0] != word[0]:
+            continue
+        distance = edit_distance(word, candidate, limit)
+        if distance <= limit:
+            # Swapped letters are the most likely typo.
+            ranked.append((distance, not is_transposition(word, candidate), candidate))
+    ranked.sort()
+    if not ranked or (len(ranked) > 1 and ranked[0][:2] == ranked[1][:2]):
+        return None
+    return ranked[0][2]
+
+
+def excerpt(text: str, start: int, end: int, context: bool = True) -> str:
+    left = max(0, start - EXCERPT_WIDTH) if context else start
+    right = min(len(text), end + EXCERPT_WIDTH)
+    return (
+        ("..." if context and left > 0 else "")
+        + " ".join(text[left:right].split())
+        + ("..." if right < len(text) else "")
+    )
+
+
+def ends_sentence(text: str, end_match: re.Match) -> bool:
+    if end_match.group() != "." or not text[end_match.end() :].strip():
+        return True
+    word_before = WORD_BEFORE_PERIOD.search(text, 0, end_match.start())
+    if word_before is None:
+        return True
+    word = word_before.group()
+    # Single capital letters are initials, as in "J. K. Rowling".
+    if word.lower() in NON_FINAL_ABBREVIATIONS or (len(word) == 1 and word.isupper()):
+        return False
+    if word.lower() in ABBREVIATIONS or "." in word:
+        return text[end_match.end() :].lstrip()[0].isupper()
+    return True
+
+
+def sentence_spans(text: str) -> list[tuple[int, int]]:
+    """Start and end of each sentence, not splitting after abbreviations and initials."""
+    spans = []
+    start = 0
+    for end_match in SENTENCE_END_PATTERN.finditer(text):
+        if ends_sentence(text, end_match):
+            spans.append((start, end_match.end()))
+            start = end_match.end()
+    if text[start:].strip():
+        spans.append((start, len(text)))
+    return spans
+
+
+def find_issues(answer: str, vocabulary: frozenset[str]) -> list[MechanicalIssue]:
+    issues: list[MechanicalIssue] = []
+
+    for offset, sentence_end in sentence_spans(answer):
+        sentence = answer[offset:sentence_end]
+        words = list(WORD_PATTERN.finditer(sentence))
+        if not words:
+            continue
+
+        for i, word_match in enumerate(words):
+            word = word_match.group()
+            start, end = offset + word_match.start(), offset + word_match.end()
+            if (i == 0 and word[0].islower()) or word == "i":
+                issues.append(
+                    MechanicalIssue(
+                        "capitalization", word, excerpt(answer, start, end), word.capitalize()
+                    )
+                )
+            # Capitalized words within a sentence are taken to be names, single letters
+            # to be initials and all-caps words to be acronyms.
+            if (
+                (i == 0 or not word[0].isupper())
+                and len(word) > 1
+                and not word.isupper()
+                and not is_known_word(word, vocabulary)
+            ):
+                suggestion = suggest_spelling(word, vocabulary)
+                if suggestion is not None:
+                    issues.append(
+                        MechanicalIssue(
+                            "spelling",
+                            word,
+                            excerpt(answer, start, end),
+                            suggestion,
+                            certain=False,
+                        )
+                    )
+            if (
+                i > 0
+                and word.lower() == words[i - 1].group().lower()
+                and word.lower() not in REPEATABLE_WORDS
+            ):
+                start = offset + words[i - 1].start()
+                issues.append(
+                    MechanicalIssue(
+                        "repeated word", answer[start:end], excerpt(answer, start, end), word
+                    )
+                )
+
+        n_conjunctions = sum(
+            word_match.group().lower() in COORDINATING_CONJUNCTIONS for word_match in words
+        )
+        if len(words) > RUN_ON_WORDS or n_conjunctions >= RUN_ON_CONJUNCTIONS:
+            start = offset + words[0].start()
+            issues.append(
+                MechanicalIssue(
+                    "run-on sentence",
+                    sentence.strip(),
+                    excerpt(answer, start, start + 2 * EXCERPT_WIDTH, context=False),
+                    certain=False,
+                )
+            )
+
+    for pattern, suggestion in [
+        (SPACE_BEFORE_PUNCTUATION, "Remove the space before the punctuation mark."),
+        (MISSING_SPACE_AFTER_COMMA, "Add a space after the punctuation mark."),
+        (MISSING_SPACE_AFTER_PERIOD, "Add a space after the end of the sentence."),
+        (REPEATED_PUNCTUATION, "Use a single punctuation mark."),
+    ]:
+        for match in pattern.finditer(answer):
+            issues.append(
+                MechanicalIssue(
+                    "punctuation",
+                    match.group(),
+                    excerpt(answer, match.start(), match.end()),
+                    suggestion,
+                )
+            )
+    end = len(answer.rstrip())
+    if end and answer[end - 1] not in ".!?\"'":
+        issues.append(
+            MechanicalIssue(
+                "punctuation",
+                answer[end - 1],
+                excerpt(answer, end - 1, end),
+                "End your last sentence with a period.",
+            )
+        )
+    return issues
+
+
+def grade_issues(issues: list[MechanicalIssue], n_words: int) -> int:
+    uncertain = [issue for issue in issues if not issue.certain]
+    graded = [issue for issue in issues if issue.certain] + uncertain[UNCERTAIN_ALLOWANCE:]
+    weighted = sum(ISSUE_WEIGHTS[issue.kind] for issue in graded)
+    issues_per_100_words = 100 * weighted / max(n_words, 1)
+    for threshold, grade in GRADE_THRESHOLDS:
+        if issues_per_100_words <= threshold:
+            return grade
+    return 1
+
+
+def format_issue(issue: MechanicalIssue) -> str:
+    if issue.kind == "spelling":
+        return f'- *{issue.found}* ("{issue.excerpt}"): did you mean **{issue.suggestion}**?'
+    if issue.kind == "capitalization":
+        return f'- *{issue.found}* ("{issue.excerpt}"): this should be written **{issue.suggestion}**.'
+    if issue.kind == "repeated word":
+        return f'- "{issue.excerpt}": the word **{issue.suggestion}** is written twice.'
+    if issue.kind == "run-on sentence":
+        return f'- "{issue.excerpt}": try splitting this long sentence into shorter ones.'
+    return f'- "{issue.excerpt}": {issue.suggestion}'
+
+
+def analyze_mechanics(answer: str, known_words: Iterable[str] = ()) -> dict:
+    """
+    Checks the mechanics of an answer without any LLM call.
+
+    Args:
+        answer (str): The student answer.
+        known_words (Iterable[str], optional): Extra correctly spelled words, e.g. those
+            of the text and question, so names and topic words aren't flagged.
+
+    Returns:
+        dict: An individual feedback: "notes", "summary", "grade" and "feedback".
+    """
+    vocabulary = load_words() | {word.lower() for word in known_words}
+    issues = find_issues(answer, vocabulary)
+    grade = grade_issues(issues, len(WORD_PATTERN.findall(answer)))
+
+    by_kind: defaultdict[str, list[MechanicalIssue]] = defaultdict(list)
+    for issue in issues:
+        by_kind[issue.kind].append(issue)
+
+    notes = "\n".join(
+        f"- {len(by_kind[kind])} {kind} issue(s)" for kind in ISSUE_TITLES if by_kind[kind]
+    ) or "- No mechanical issues found"
+    if not issues:
+        feedback = "I read your answer carefully and did not find any spelling, capitalization or punctuation mistakes. Keep it up!"
+    else:
+        sections = ["Here are some things to fix when you read your answer again:"]
+        for kind, title in ISSUE_TITLES.items():
+            if not by_kind[kind]:
+                continue
+            examples = [format_issue(issue) for issue in by_kind[kind][:MAX_EXAMPLES]]
+            if len(by_kind[kind]) > MAX_EXAMPLES:
+                examples.append(f"- ...and {len(by_kind[kind]) - MAX_EXAMPLES} more like these.")
+            sections.append(f"#### {title}\n" + "\n".join(examples))
+        feedback = "\n\n".join(sections)
+
+    return {
+        "notes": notes,
+        "summary": SUMMARIES[grade],
+        "grade": grade,
+        "feedback": feedback,
+    }
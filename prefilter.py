@@ -0,0 +1,222 @@
+import re
+from typing import Callable
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+SENTENCE_END_PATTERN = re.compile(r"[.!?]+(?:\s|$)")
+VOWEL_GROUP_PATTERN = re.compile(r"[aeiouy]+")
+
+# How many sections are sent on to the LLM ranking by default.
+PREFILTER_TOP_K = 8
+TARGET_GRADE = 4
+# Relevance matters more than readability: texts get simplified before being shown.
+RELEVANCE_WEIGHT = 2.0
+READABILITY_WEIGHT = 1.0
+# Titles are short but very informative, so their terms count extra.
+TITLE_WEIGHT = 3
+# Texts at least this similar (cosine of their shingle TF-IDF vectors) are considered
+# the same. Calibrated on FRQs generated for one text (see tests/test_prefilter.py):
+# rephrasings of the same question score 0.4-0.8, distinct questions at most ~0.4.
+# Merging two distinct questions loses a candidate, so ties go to keeping both.
+NEAR_DUPLICATE_THRESHOLD = 0.45
+# Length of the character shingles compared, so that e.g. "umpire" and "umpires'" or
+# "headgear" and "gear" still overlap after stemming.
+SHINGLE_SIZE = 4
+STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from has have how in is it its of on "
+    "or that the their them they this to was were what which who why will with you your".split()
+)
+# Instructions every question has in some form, which say nothing about what it asks.
+QUESTION_BOILERPLATE = frozenset(
+    "about according analyse analyze answer assess describe detail details discuss "
+    "evaluate evidence explain opinion over support text think time today use using".split()
+)
+# Different ways of phrasing the same ask, e.g. "the evolution of" and "how ... changed".
+SYNONYMS = {
+    word: canonical
+    for canonical, words in {
+        "change": "change changed changes changing develop developed development evolution "
+        "evolve evolved evolves transform transformed",
+        "differ": "compare compared contrast differ difference differences different",
+        "begin": "began begin beginning start started",
+    }.items()
+    for word in words.split()
+}
+STEM_SUFFIXES = ("ations", "ation", "ings", "ing", "ies", "ied", "ers", "er", "ed", "es", "s", "ly")
+
+
+def count_syllables(word: str) -> int:
+    syllables = len(VOWEL_GROUP_PATTERN.findall(word))
+    if word.endswith("e") and not word.endswith(("le", "ee")) and syllables > 1:
+        syllables -= 1
+    return max(1, syllables)
+
+
+def readability_metrics(texts: list[str]) -> dict[str, np.ndarray]:
+    """
+    Computes Flesch-Kincaid grade level and its components for a batch of texts.
+
+    Returns:
+        dict[str, np.ndarray]: "grade", "words_per_sentence" and "syllables_per_word",
+            one value per text.
+    """
+    n_words = np.zeros(len(texts))
+    n_sentences = np.zeros(len(texts))
+    n_syllables = np.zeros(len(texts))
+    for i, text in enumerate(texts):
+        words = TOKEN_PATTERN.findall(text.lower())
+        n_words[i] = len(words)
+        n_sentences[i] = len(SENTENCE_END_PATTERN.findall(text))
+        n_syllables[i] = sum(count_syllables(word) for word in words)
+
+    words_per_sentence = n_words / np.maximum(n_sentences, 1)
+    syllables_per_word = n_syllables / np.maximum(n_words, 1)
+    grade = 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59
+    return {
+        "grade": grade,
+        "words_per_sentence": words_per_sentence,
+        "syllables_per_word": syllables_per_word,
+    }
+
+
+def stem(word: str) -> str:
+    """Strips the most common English suffix, so inflections count as the same term."""
+    for suffix in STEM_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[: -len(suffix)]
+            break
+    return word[:-1] if word.endswith("e") and len(word) > 3 else word
+
+
+def paraphrase_terms(text: str) -> list[str]:
+    """
+    The terms compared to find rephrasings of a question: the character shingles of its
+    stemmed content words, with different phrasings of the same ask made identical.
+    """
+    shingles = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS or token in QUESTION_BOILERPLATE:
+            continue
+        padded = f" {stem(SYNONYMS.get(token, token))} "
+        shingles += [
+            padded[i : i + SHINGLE_SIZE]
+            for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))
+        ]
+    return shingles
+
+
+def tfidf_matrix(
+    documents: list[str],
+    stopwords: frozenset[str] = frozenset(),
+    tokenize: Callable[[str], list[str]] | None = None,
+) -> tuple[np.ndarray, dict[str, int], np.ndarray]:
+    """
+    Builds the (sublinear) TF-IDF matrix of a batch of documents, of their words or of
+    the terms `tokenize` returns.
+
+    Returns:
+        tuple[np.ndarray, dict[str, int], np.ndarray]: The documents x terms matrix, the
+            term -> column vocabulary and the idf of each term.
+    """
+    tokenized = [
+        [
+            token
+            for token in (
+                tokenize(document) if tokenize else TOKEN_PATTERN.findall(document.lower())
+            )
+            if token not in stopwords
+        ]
+        for document in documents
+    ]
+    vocabulary: dict[str, int] = {}
+    for tokens in tokenized:
+        for token in tokens:
+            vocabulary.setdefault(token, len(vocabulary))
+
+    counts = np.zeros((len(documents), len(vocabulary)))
+    for i, tokens in enumerate(tokenized):
+        np.add.at(counts[i], [vocabulary[token] for token in tokens], 1)
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+    return np.log1p(counts) * idf, vocabulary, idf
+
+
+def tfidf_relevance(documents: list[str], query: str) -> np.ndarray:
+    """Cosine similarity between each document and the query in TF-IDF space."""
+    tfidf, vocabulary, idf = tfidf_matrix(documents)
+    query_ids = [vocabulary[t] for t in TOKEN_PATTERN.findall(query.lower()) if t in vocabulary]
+    if not vocabulary or not query_ids:
+        return np.zeros(len(documents))
+
+    query_vector = np.zeros(len(vocabulary))
+    np.add.at(query_vector, query_ids, 1)
+    query_vector = np.log1p(query_vector) * idf
+
+    norms = np.linalg.norm(tfidf, axis=1) * np.linalg.norm(query_vector)
+    return tfidf @ query_vector / np.maximum(norms, 1e-12)
+
+
+def near_duplicate_clusters(
+    texts: list[str], threshold: float = NEAR_DUPLICATE_THRESHOLD
+) -> list[list[int]]:
+    """
+    Groups texts whose TF-IDF cosine similarity (over their paraphrase_terms) is at
+    least `threshold`. Each cluster is led by its earliest text, which comes first in
+    the cluster; clusters are in order of their leader.
+    """
+    if not texts:
+        return []
+    tfidf, _, _ = tfidf_matrix(texts, tokenize=paraphrase_terms)
+    normalized = tfidf / np.maximum(np.linalg.norm(tfidf, axis=1, keepdims=True), 1e-12)
+    similarity = normalized @ normalized.T
+
+    clusters = []
+    assigned = np.zeros(len(texts), dtype=bool)
+    for leader in range(len(texts)):
+        if assigned[leader]:
+            continue
+        members = np.flatnonzero(~assigned & (similarity[leader] >= threshold))
+        members = [leader] + [int(i) for i in members if i != leader]
+        assigned[members] = True
+        clusters.append(members)
+    return clusters
+
+
+def standardize(values: np.ndarray) -> np.ndarray:
+    spread = values.std()
+    return (values - values.mean()) / spread if spread > 0 else np.zeros_like(values)
+
+
+def prefilter_sections(
+    sections: list[tuple[str, str, str]], topic: str, k: int = PREFILTER_TOP_K
+) -> list[tuple[str, str, str]]:
+    """
+    Cheaply narrows down the candidate sections before they are ranked by the LLM, by
+    relevance to the topic and closeness to a 4th-grade reading level.
+
+    Args:
+        sections (list[tuple[str, str, str]]): (text, section title, page title) tuples
+            as returned by extract_sections.
+        topic (str): Topic of interest.
+        k (int, optional): Number of sections to keep. Defaults to PREFILTER_TOP_K.
+
+    Returns:
+        list[tuple[str, str, str]]: The k most promising sections, best first.
+    """
+    if len(sections) <= k:
+        return sections
+
+    # A section titled "History" is only relevant through the page it is on.
+    documents = [
+        f"{(page_title + ' ' + title + ' ') * TITLE_WEIGHT}{text}"
+        for text, title, page_title in sections
+    ]
+    relevance = tfidf_relevance(documents, topic)
+    grade = readability_metrics([text for text, _, _ in sections])["grade"]
+
+    scores = RELEVANCE_WEIGHT * standardize(relevance) - READABILITY_WEIGHT * standardize(
+        np.abs(grade - TARGET_GRADE)
+    )
+    best = np.argsort(-scores, kind="stable")[:k]
+    return [sections[i] for i in best]
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import time
+
+from frq import BIAS_FREE_CUTOFF, frq_score
+from ranking import RankingPolicy, top_k
+from sqlite_store import SQLiteStore
+
+QUESTION_BANK_PATH = os.environ.get("QUESTION_BANK_PATH", ".question_bank.sqlite3")
+
+
+def text_key(text: str, model: str) -> str:
+    """Fingerprint of a formatted text and the model its questions come from."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class QuestionBank(SQLiteStore):
+    """
+    The FRQs generated for each text and their assessments, so a student landing on a
+    text someone already read gets a question without any LLM call. Texts are keyed by
+    text_key, so switching models doesn't serve another model's questions. Only
+    complete results belong here: a cut-short set of FRQs would be served for good.
+    """
+
+    schema = (
+        """
+        CREATE TABLE IF NOT EXISTS generations (
+            text_key TEXT PRIMARY KEY,
+            frqs TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS assessments (
+            text_key TEXT NOT NULL,
+            frq TEXT NOT NULL,
+            assessment TEXT NOT NULL,
+            score REAL NOT NULL,
+            eligible INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (text_key, frq)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS assessments_by_score"
+        " ON assessments (text_key, eligible, score)",
+    )
+
+    def __init__(self, path: str = QUESTION_BANK_PATH):
+        super().__init__(path)
+
+    def get_frqs(self, key: str) -> list[str] | None:
+        with self.transaction() as connection:
+            row = connection.execute(
+                "SELECT frqs FROM generations WHERE text_key = ?", (key,)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def add_frqs(self, key: str, frqs: list[str]) -> None:
+        with self.transaction() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO generations VALUES (?, ?, ?)",
+                (key, json.dumps(frqs), time.time()),
+            )
+
+    def get_assessments(self, key: str) -> list[dict]:
+        """All banked assessments of the text's FRQs, in the order they were added."""
+        with self.transaction() as connection:
+            rows = connection.execute(
+                "SELECT assessment FROM assessments WHERE text_key = ? ORDER BY rowid",
+                (key,),
+            ).fetchall()
+        return [json.loads(assessment) for assessment, in rows]
+
+    def add_assessments(self, key: str, frq_rankings: list[dict]) -> None:
+        now = time.time()
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO assessments VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        key,
+                        frq_ranking["frq"],
+                        json.dumps(frq_ranking),
+                        frq_score(frq_ranking),
+                        frq_ranking["bias_free_score"] >= BIAS_FREE_CUTOFF,
+                        now,
+                    )
+                    for frq_ranking in frq_rankings
+                ],
+            )
+
+    def top_frqs(
+        self, key: str, n: int = 1, policy: RankingPolicy | None = None
+    ) -> list[dict]:
+        """
+        The n best banked FRQs of the text, by the same score and bias-free cutoff as
+        select_best_frq, each with its "score" set. With a policy, the banked
+        assessments are re-ranked by it instead.
+        """
+        if policy is not None:
+            return top_k(self.get_assessments(key), policy, n)
+        with self.transaction() as connection:
+            rows = connection.execute(
+                "SELECT assessment, score FROM assessments"
+                " WHERE text_key = ? AND eligible ORDER BY score DESC, rowid LIMIT ?",
+                (key, n),
+            ).fetchall()
+        return [{**json.loads(assessment), "score": score} for assessment, score in rows]
+
+    def clear(self) -> None:
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM generations")
+            connection.execute("DELETE FROM assessments")
+
+
+_question_bank: QuestionBank | None = None
+
+
+def get_question_bank() -> QuestionBank:
+    global _question_bank
+    if _question_bank is None:
+        _question_bank = QuestionBank()
+    return _question_bank
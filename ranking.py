@@ -0,0 +1,94 @@
+"""
+Selection policies over LLM assessments. Assessments are turned into a (candidates x
+criteria) score matrix, so a policy (weights, hard filters, tie-breaking) ranks any
+number of stored assessments at once, and re-tuning it needs no new LLM calls.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+FILTER_OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+}
+
+
+class RankingPolicy(NamedTuple):
+    # Criterion -> weight; a candidate's score is the weighted average of its criteria.
+    weights: dict[str, float]
+    # Criterion -> (operator, threshold) that candidates must satisfy, e.g. (">=", 5).
+    filters: dict[str, tuple[str, float]] = {}
+    # Criteria breaking ties between equal scores, in order, higher first. Remaining
+    # ties keep the order of the assessments.
+    tie_breakers: tuple[str, ...] = ()
+
+    @property
+    def criteria(self) -> list[str]:
+        return list(dict.fromkeys([*self.weights, *self.filters, *self.tie_breakers]))
+
+
+def score_matrix(assessments: list[dict], criteria: list[str]) -> np.ndarray:
+    """The scores of each assessment (rows) on each criterion (columns)."""
+    return np.array(
+        [[float(assessment[criterion]) for criterion in criteria] for assessment in assessments],
+        dtype=float,
+    ).reshape(len(assessments), len(criteria))
+
+
+def rank_matrix(
+    scores: np.ndarray, criteria: list[str], policy: RankingPolicy
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Ranks the rows of a score matrix.
+
+    Args:
+        scores (np.ndarray): (candidates x criteria) matrix, as built by score_matrix.
+        criteria (list[str]): Criterion of each column; must include policy.criteria.
+        policy (RankingPolicy): How to score, filter and order the candidates.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The indices of the candidates passing the filters,
+            best first, and the weighted score of every candidate.
+    """
+    column = {criterion: i for i, criterion in enumerate(criteria)}
+    weights = np.zeros(len(criteria))
+    for criterion, weight in policy.weights.items():
+        weights[column[criterion]] = weight
+    weighted = scores @ weights / sum(policy.weights.values())
+
+    keep = np.ones(len(scores), dtype=bool)
+    for criterion, (operator, threshold) in policy.filters.items():
+        keep &= FILTER_OPERATORS[operator](scores[:, column[criterion]], threshold)
+
+    # np.lexsort sorts by its last key first, ascending.
+    sort_keys = [np.arange(len(scores))]
+    sort_keys += [-scores[:, column[criterion]] for criterion in reversed(policy.tie_breakers)]
+    sort_keys.append(-weighted)
+    order = np.lexsort(sort_keys)
+    return order[keep[order]], weighted
+
+
+def weighted_score(assessment: dict, policy: RankingPolicy) -> float:
+    return sum(
+        assessment[criterion] * weight for criterion, weight in policy.weights.items()
+    ) / sum(policy.weights.values())
+
+
+def top_k(
+    assessments: list[dict],
+    policy: RankingPolicy,
+    k: int | None = None,
+    score_key: str = "score",
+) -> list[dict]:
+    """
+    The k best assessments passing the policy's filters (all of them if k is None),
+    best first. Returns copies with their weighted score under `score_key`; the
+    assessments themselves are left untouched.
+    """
+    criteria = policy.criteria
+    order, weighted = rank_matrix(score_matrix(assessments, criteria), criteria, policy)
+    return [
+        {**assessments[i], score_key: float(weighted[i])} for i in order[:k].tolist()
+    ]
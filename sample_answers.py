@@ -0,0 +1,133 @@
+"""
+Speculative generation of the sample student answers. Once a question is chosen, the
+good, mediocre and bad answers are generated in the background, so that asking for one
+resolves instantly instead of waiting on the LLM.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from collections import OrderedDict
+
+from student import answer_question_as_student
+
+ANSWER_DESCRIPTIONS = {
+    "good": "Excellent answer, the best that can possibly be expected from a fourth-grader. All of the relevant information is included, and the answer is well-structured and easy to follow. The answer is also free of grammatical errors and typos.",
+    "mediocre": "A mediocre answer. The answer is somewhat relevant, but it is not well-structured and it is hard to follow. There are a few grammatical errors and typos, but the answer is still readable.",
+    "bad": "A terrible answer. The answer does not answer the question, and is completely unstructured and full of non-sequiturs. It's also FULL of grammatical errors and typos, badly formatted, and hard to read.",
+}
+# Speculative requests running at once across all sessions, so they stay in the
+# background of the requests students are actually waiting on.
+BACKGROUND_CONCURRENCY = 2
+# Sample answers kept per session.
+MAX_ENTRIES = 12
+# Times a failed prefetch is started again, on later reruns, before leaving the answer
+# to be generated when it is asked for.
+MAX_ATTEMPTS = 2
+
+_background_loop: asyncio.AbstractEventLoop | None = None
+_background_semaphore: asyncio.Semaphore | None = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop running forever in a daemon thread, for work that outlives a page run."""
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_background_loop.run_forever, name="background-llm", daemon=True
+            ).start()
+        return _background_loop
+
+
+class PrefetchEntry:
+    def __init__(
+        self, future: concurrent.futures.Future, started: threading.Event, attempt: int = 1
+    ):
+        self.future = future
+        # Set once the request is actually sent, as opposed to waiting for a slot.
+        self.started = started
+        # How many times this answer has been prefetched, this one included.
+        self.attempt = attempt
+
+    def failed(self) -> bool:
+        return self.future.done() and (
+            self.future.cancelled() or self.future.exception() is not None
+        )
+
+
+class SampleAnswerPrefetcher:
+    """
+    Per-session cache of the sample answers for (frq, text, model), filled in the
+    background. Moving on to another question or model cancels what is still pending
+    for the previous one. A failed prefetch is retried on later calls, at most
+    MAX_ATTEMPTS times in total.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_attempts: int = MAX_ATTEMPTS):
+        self.max_entries = max_entries
+        self.max_attempts = max_attempts
+        self._entries: OrderedDict[tuple[str, str, str, str], PrefetchEntry] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, frq: str, text: str, model: str) -> None:
+        """Starts generating every quality of answer to `frq` that isn't cached yet."""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key[:3] != (frq, text, model) and not entry.future.done():
+                    entry.future.cancel()
+                    del self._entries[key]
+            for quality in ANSWER_DESCRIPTIONS:
+                key = (frq, text, model, quality)
+                entry = self._entries.get(key)
+                if entry is not None and (
+                    not entry.failed() or entry.attempt >= self.max_attempts
+                ):
+                    self._entries.move_to_end(key)
+                    continue
+                attempt = 1 if entry is None else entry.attempt + 1
+                self._entries[key] = self._schedule(frq, text, model, quality, attempt)
+            while len(self._entries) > self.max_entries:
+                _, entry = self._entries.popitem(last=False)
+                entry.future.cancel()
+
+    def _schedule(
+        self, frq: str, text: str, model: str, quality: str, attempt: int
+    ) -> PrefetchEntry:
+        started = threading.Event()
+
+        async def generate() -> str:
+            global _background_semaphore
+            if _background_semaphore is None:
+                _background_semaphore = asyncio.Semaphore(BACKGROUND_CONCURRENCY)
+            async with _background_semaphore:
+                started.set()
+                return await answer_question_as_student(
+                    frq, text, ANSWER_DESCRIPTIONS[quality], model=model
+                )
+
+        return PrefetchEntry(
+            asyncio.run_coroutine_threadsafe(generate(), get_background_loop()),
+            started,
+            attempt,
+        )
+
+    def take(self, frq: str, text: str, model: str, quality: str) -> str | None:
+        """
+        The prefetched answer, waiting for it if its request is already in flight. Returns
+        None (and cancels the prefetch) if it hasn't started or failed, for the caller to
+        generate the answer itself.
+        """
+        with self._lock:
+            entry = self._entries.get((frq, text, model, quality))
+        if entry is None:
+            return None
+        if not entry.future.done() and not entry.started.is_set():
+            entry.future.cancel()
+            return None
+        try:
+            return entry.future.result()
+        except Exception as error:
+            print(f"Prefetched {quality} answer unavailable: {error!r}")
+            return None
@@ -0,0 +1,32 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SQLiteStore:
+    """
+    Base of the on-disk stores. Every Streamlit session runs in its own thread, so they
+    all share one connection, in WAL mode, and take turns through a lock. Subclasses
+    list the statements that create their tables in `schema`.
+    """
+
+    schema: tuple[str, ...] = ()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self.transaction() as connection:
+            for statement in self.schema:
+                connection.execute(statement)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Holds the lock for a series of statements, committing them at the end or rolling
+        them back on an exception.
+        """
+        with self._lock, self._connection:
+            yield self._connection
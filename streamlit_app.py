@@ -1,22 +1,92 @@
 import asyncio
+import json
 from time import time
 import aiohttp
 import pandas as pd
 import streamlit as st
-from frq import generate_frqs, select_best_frq, assess_frq
+from frq import (
+    assess_frq,
+    assess_frqs_batched,
+    deduplicate_frqs,
+    generate_frqs,
+    is_eligible_frq,
+    rank_frqs_cascade,
+    rank_frqs_successive_halving,
+    SuccessiveHalvingConfig,
+    select_best_frq,
+)
 from wikitext import (
     clean_and_format_text,
     extract_sections,
     fetch_relevant_wikipedia_pages,
     rank_section,
+    rank_sections_cascade,
+    rank_sections_until_good_enough,
+    is_eligible_text,
     select_best_text,
 )
-from feedback import give_feedback_on_answer, rewrite_text_according_to_feedback
+from prefilter import PREFILTER_TOP_K, prefilter_sections
+from deadline import NO_DEADLINE, Deadline, gather_within
+from feedback import (
+    GRADING_PARAMETERS,
+    give_feedback_on_answer,
+    rewrite_text_according_to_feedback,
+)
 from student import answer_question_as_student
+from feedback_session import FeedbackSession
+from sample_answers import ANSWER_DESCRIPTIONS, SampleAnswerPrefetcher
+from question_bank import get_question_bank, text_key
 
 # from llm import openai
 import llm
 
+# Default time a student is expected to wait for a page, in seconds.
+PAGE_BUDGET_SECONDS = 180
+# With less time than this left, fewer candidate questions are generated.
+LOW_FRQ_BUDGET_SECONDS = 60
+
+
+class DegradedResult(Exception):
+    """
+    Raised out of a cached function with a result computed under a cut-short deadline,
+    so that st.cache_data doesn't keep it. See uncached_if_degraded.
+    """
+
+    def __init__(self, result):
+        super().__init__("Result computed under a cut-short deadline")
+        self.result = result
+
+
+def raise_if_degraded(result, deadline):
+    if deadline.degraded:
+        raise DegradedResult(result)
+    return result
+
+
+def uncached_if_degraded(cached_function, *args, **kwargs):
+    """
+    Calls a cached function, returning the degraded results it didn't cache too.
+
+    A degraded result is kept in the session state instead, so that reruns for the same
+    inputs keep showing it rather than recomputing it (and possibly changing the text or
+    question mid-session). Only the latest inputs are kept per function.
+    """
+    # The same inputs st.cache_data hashes: `_`-prefixed arguments aren't part of them.
+    inputs = json.dumps(
+        [args, {name: value for name, value in kwargs.items() if not name.startswith("_")}],
+        sort_keys=True,
+    )
+    degraded_results = st.session_state.setdefault("degraded_results", {})
+    stored = degraded_results.get(cached_function.__name__)
+    if stored is not None and stored[0] == inputs:
+        return stored[1]
+    try:
+        return cached_function(*args, **kwargs)
+    except DegradedResult as degraded:
+        print("Not caching a result the deadline cut short")
+        degraded_results[cached_function.__name__] = (inputs, degraded.result)
+        return degraded.result
+
 
 async def get_sections(topic):
     async with aiohttp.ClientSession() as session:
@@ -39,72 +109,263 @@ def get_sections_sync(topic):
     return sections
 
 
-async def get_best_text(sections, topic):
+async def get_best_text(
+    sections,
+    topic,
+    use_cascade=False,
+    prefilter_k=PREFILTER_TOP_K,
+    early_stop=False,
+    deadline=NO_DEADLINE,
+):
     start_time = time()
-    results = await asyncio.gather(
-        *[rank_section(section[0], section[1], topic) for section in sections]
-    )
+    # Only the most promising sections are worth an LLM ranking call.
+    sections = prefilter_sections(sections, topic, k=prefilter_k)
+    print(f"Kept {len(sections)} sections after prefiltering")
+    # Keep part of the budget for simplifying the selected text.
+    ranking_deadline = deadline.portion(0.6)
+    if use_cascade:
+        results = await rank_sections_cascade(sections, topic, deadline=ranking_deadline)
+    elif early_stop:
+        results = await rank_sections_until_good_enough(
+            sections, topic, deadline=ranking_deadline
+        )
+    else:
+        results = await gather_within(
+            [rank_section(section[0], section[1], topic) for section in sections],
+            ranking_deadline,
+            min_results=3,
+            usable=is_eligible_text,
+        )
     print(f"Total time: {time() - start_time}")
 
-    print(f"Got text rankings, selecting the best one...")
-    best_text = select_best_text(results)
+    if not any(is_eligible_text(result) for result in results):
+        print("None of the texts is age-appropriate")
+        return None
 
-    best_text_formatted = await clean_and_format_text(best_text["text"])
-    return best_text_formatted, best_text
+    print(f"Got text rankings, selecting the best one...")
+    return select_best_text(results)
 
 
 @st.cache_data
-def get_best_text_sync(sections, topic):
+def get_best_text_sync(
+    sections,
+    topic,
+    use_cascade=False,
+    prefilter_k=PREFILTER_TOP_K,
+    early_stop=False,
+    _deadline=NO_DEADLINE,
+):
     loop = asyncio.get_event_loop()
-    best_text_formatted, best_text = loop.run_until_complete(
-        get_best_text(sections, topic)
+    # Only this stage's degradations count.
+    deadline = _deadline.portion(1.0)
+    best_text = loop.run_until_complete(
+        get_best_text(sections, topic, use_cascade, prefilter_k, early_stop, deadline)
     )
-    return best_text_formatted, best_text
+    return raise_if_degraded(best_text, deadline)
 
 
-@st.cache_data
-def generate_frqs_sync(text):
-    loop = asyncio.get_event_loop()
-    frqs = loop.run_until_complete(generate_frqs(text))
-    return frqs
+class NotCached(Exception):
+    pass
+
+
+# The streaming stages below aren't wrapped in st.cache_data: writes to a placeholder
+# created outside a cached function can't be replayed on a cache hit. Only their final
+# text is cached, once streamed, in the same way as cached_feedback.
 
 
 @st.cache_data
-def rank_frqs_sync(frqs, text):
+def cached_text(stage, inputs, _text=None):
+    """
+    Store of the final texts of the streaming stages: raises NotCached on a miss, and
+    passing `_text` stores it. `inputs` identify the request within `stage`.
+    """
+    if _text is None:
+        raise NotCached()
+    return _text
+
+
+def stream_once(stage, inputs, stream):
+    """
+    Returns the cached text of `stage` for `inputs`, or awaits `stream()` and caches its
+    text. A cached text is returned at once, without streaming it again.
+    """
+    inputs = (*inputs, llm.openai.MODEL)
+    try:
+        return cached_text(stage, inputs)
+    except NotCached:
+        pass
     loop = asyncio.get_event_loop()
-    frq_rankings = loop.run_until_complete(
-        asyncio.gather(*[assess_frq(frq, text) for frq in frqs])
+    text = loop.run_until_complete(stream())
+    cached_text(stage, inputs, _text=text)
+    return text
+
+
+def clean_and_format_text_sync(text, on_token=None):
+    return stream_once(
+        "clean_and_format_text", (text,), lambda: clean_and_format_text(text, on_token)
     )
-    return frq_rankings
 
 
 @st.cache_data
-def answer_question_sync(best_frq, best_text_formatted, response_prompt):
+def generate_frqs_sync(text, fresh=False, _deadline=NO_DEADLINE):
+    """`fresh` generates new FRQs, bypassing the bank and the LLM response cache."""
     loop = asyncio.get_event_loop()
-    answer = loop.run_until_complete(
-        answer_question_as_student(
-            best_frq["frq"], best_text_formatted, response_prompt
-        )
-    )
-    return answer
+    deadline = _deadline.portion(1.0)
+    key = text_key(text, llm.openai.MODEL)
+    frqs = None if fresh else get_question_bank().get_frqs(key)
+    if frqs is None:
+        n_frqs = 10
+        if deadline.remaining() <= LOW_FRQ_BUDGET_SECONDS:
+            n_frqs = 5
+            deadline.mark_degraded()
+        frqs = loop.run_until_complete(generate_frqs(text, n_frqs, use_cache=not fresh))
+        # The bank keeps results for good, so only complete ones go in.
+        if not deadline.degraded:
+            get_question_bank().add_frqs(key, frqs)
+    return raise_if_degraded(frqs, deadline)
 
 
 @st.cache_data
-def give_feedback_sync(answer, frq, text):
+def rank_frqs_sync(
+    frqs, text, use_cascade=False, batched=False, screen=False, _deadline=NO_DEADLINE
+):
     loop = asyncio.get_event_loop()
-    feedbacks = loop.run_until_complete(give_feedback_on_answer(answer, frq, text))
-    return feedbacks
+    deadline = _deadline.portion(1.0)
+    key = text_key(text, llm.openai.MODEL)
+    banked = [
+        frq_ranking
+        for frq_ranking in get_question_bank().get_assessments(key)
+        if frq_ranking["frq"] in frqs
+    ]
+    if any(is_eligible_frq(frq_ranking) for frq_ranking in banked):
+        return banked
+
+    if screen:
+        # With cascade scoring, the finalists get the full rubric from the expensive model.
+        config = SuccessiveHalvingConfig(
+            final_model=llm.STAGE_CASCADES["assess_frq"].expensive_model if use_cascade else None
+        )
+        frq_rankings = loop.run_until_complete(
+            rank_frqs_successive_halving(frqs, text, config, deadline=deadline)
+        )
+    elif use_cascade:
+        frq_rankings = loop.run_until_complete(
+            rank_frqs_cascade(frqs, text, deadline=deadline)
+        )
+    elif batched:
+        frq_rankings = loop.run_until_complete(
+            assess_frqs_batched(frqs, text, deadline=deadline)
+        )
+    else:
+        frq_rankings = loop.run_until_complete(
+            gather_within(
+                [assess_frq(frq, text) for frq in frqs], deadline, usable=is_eligible_frq
+            )
+        )
+    # Assessments without an eligible FRQ are of no use to later students.
+    if not deadline.degraded and any(
+        is_eligible_frq(frq_ranking) for frq_ranking in frq_rankings
+    ):
+        get_question_bank().add_assessments(key, frq_rankings)
+    return raise_if_degraded(frq_rankings, deadline)
+
+
+def answer_question_sync(best_frq, best_text_formatted, response_prompt, on_token=None):
+    return stream_once(
+        "answer_question",
+        (best_frq["frq"], best_text_formatted, response_prompt),
+        lambda: answer_question_as_student(
+            best_frq["frq"], best_text_formatted, response_prompt, on_token
+        ),
+    )
 
 
 @st.cache_data
-def rewrite_text_according_to_feedback_sync(text, question, answer, feedback):
+def cached_feedback(
+    answer, frq, text, mode="thorough", mechanics="llm", session_digest=None, _feedbacks=None
+):
+    """
+    Store of final feedbacks: raises NotCached on a miss, and passing `_feedbacks` stores
+    them. Feedbacks are computed by give_feedback_sync, outside of st.cache_data, so
+    they can be rendered as they come in. `session_digest` identifies the previous
+    answer and feedback that revised feedbacks depend on.
+    """
+    if _feedbacks is None:
+        raise NotCached()
+    return _feedbacks
+
+
+def give_feedback_sync(
+    answer,
+    frq,
+    text,
+    mode="thorough",
+    mechanics="llm",
+    deadline=NO_DEADLINE,
+    on_parameter=None,
+    session=None,
+):
     loop = asyncio.get_event_loop()
-    rewritten_answer = loop.run_until_complete(
-        rewrite_text_according_to_feedback(
-            text=text, question=question, answer=answer, feedback=feedback
+    if session is not None:
+        # Only revises the feedbacks affected by the edits since the last submission.
+        return loop.run_until_complete(
+            session.give_feedback(answer, deadline, mode, on_parameter, mechanics)
         )
+    return loop.run_until_complete(
+        give_feedback_on_answer(answer, frq, text, deadline, mode, on_parameter, mechanics)
+    )
+
+
+def rewrite_text_according_to_feedback_sync(
+    text, question, answer, feedback, on_token=None
+):
+    return stream_once(
+        "rewrite_text_according_to_feedback",
+        (text, question, answer, feedback),
+        lambda: rewrite_text_according_to_feedback(
+            text=text,
+            question=question,
+            answer=answer,
+            feedback=feedback,
+            on_token=on_token,
+        ),
     )
-    return rewritten_answer
+
+
+def render_feedback(feedback_category, feedback):
+    grade = f"{feedback['aggregated_grade']}/5"
+
+    color = (
+        "green"
+        if feedback["aggregated_grade"] > 3
+        else "black"
+        if feedback["aggregated_grade"] == 3
+        else "red"
+    )
+    label = f"""## {feedback_category}: :{color}[{grade}]
+{feedback['aggregated_summary']}
+*(click here to view detailed feedback)*
+    """
+
+    with st.expander(label=label, expanded=False):
+        newline = "\n"
+        st.write(
+            f"""
+#### Detailed feedback: 
+{feedback['aggregated_feedback'].replace(newline, '  ' + newline)}
+"""
+        )
+
+
+def stream_into(placeholder):
+    """Returns a callback that renders streamed tokens into `placeholder` as they arrive."""
+    tokens = []
+
+    def on_token(token):
+        tokens.append(token)
+        placeholder.markdown("".join(tokens) + "▌")
+
+    return on_token
 
 
 def main():
@@ -121,10 +382,80 @@ def main():
                 f"*WARNING: GPT-4 gives much better results but is slow (~40 sec/step) and expensive (~1-2$ for a full run)*"
             )
 
+        use_cascade = st.checkbox(
+            "Cascade scoring",
+            value=False,
+            key="use_cascade",
+            help="Score texts and questions with GPT-3.5 first and only re-score the best candidates with GPT-4.",
+        )
+
+        prefilter_k = st.slider(
+            "Texts ranked by the model",
+            min_value=1,
+            max_value=30,
+            value=PREFILTER_TOP_K,
+            key="prefilter_k",
+            help="Candidate texts are first narrowed down locally by relevance and readability.",
+        )
+
+        early_stop = st.checkbox(
+            "Stop at the first good text",
+            value=False,
+            key="early_stop",
+            help="Pick a text as soon as a good enough one is ranked instead of waiting for all rankings (ignored with cascade scoring).",
+        )
+
+        batched_frq_assessment = st.checkbox(
+            "Assess all questions in one call",
+            value=False,
+            key="batched_frq_assessment",
+            help="Score every candidate question in a single request instead of one request per question (ignored with cascade scoring or screening).",
+        )
+
+        screen_frqs = st.checkbox(
+            "Screen questions before full scoring",
+            value=False,
+            key="screen_frqs",
+            help="Score questions on bias, feasibility and alignment first and only score the best half on the full rubric (with GPT-4 when cascade scoring is on).",
+        )
+
+        feedback_mode = st.radio(
+            "Feedback",
+            options=["Thorough", "Adaptive", "Fast"],
+            index=0,
+            key="feedback_mode",
+            help="Thorough feedback combines several feedbacks per rubric parameter; adaptive feedback only does so when the first feedbacks disagree; fast feedback covers all parameters in a single call.",
+        )
+
+        mechanics_toggle = st.radio(
+            "Mechanical accuracy",
+            options=["LLM", "Local", "Local, reworded by the LLM"],
+            index=0,
+            key="mechanics_toggle",
+            help="Check spelling, capitalization and punctuation with the LLM or with a fast offline checker.",
+        )
+        mechanics_mode = {
+            "LLM": "llm",
+            "Local": "local",
+            "Local, reworded by the LLM": "polished",
+        }[mechanics_toggle]
+
+        page_budget = st.slider(
+            "Time budget per page (seconds)",
+            min_value=30,
+            max_value=600,
+            value=PAGE_BUDGET_SECONDS,
+            key="page_budget",
+            help="When time runs low, steps settle for the results they already have.",
+        )
+
         clear = st.button("Clear cache")
         if clear:
             st.cache_data.clear()
             st.cache_resource.clear()
+            # Otherwise every LLM response and question would be served again from disk.
+            llm.get_response_cache().clear()
+            get_question_bank().clear()
             # also clear the session state
             st.session_state.clear()
             st.experimental_rerun()
@@ -146,6 +477,8 @@ def main():
         submit_topic = st.form_submit_button("Give me a question!")
 
     if submit_topic or st.session_state.get("topic"):
+        # Everything computed during this run shares the page's time budget.
+        deadline = Deadline(page_budget)
         # save the topic in the session state so we don't have to re-enter it
         st.session_state["topic"] = topic
         # When the button is clicked, fetch the relevant wikipedia pages - indicate that in a status text
@@ -158,10 +491,29 @@ def main():
             )
             return
 
+        text_placeholder = st.empty()
         with st.spinner(
             f"I found {len(sections)} potential texts - selecting the best one for you..."
         ):
-            best_text_formatted, best_text = get_best_text_sync(sections, topic)
+            best_text = uncached_if_degraded(
+                get_best_text_sync,
+                sections,
+                topic,
+                use_cascade,
+                prefilter_k,
+                early_stop,
+                _deadline=deadline.portion(0.5),
+            )
+        if best_text is None:
+            st.error(
+                f"Sorry, I couldn't find a text about {topic} that is right for your age. Please try another topic."
+            )
+            return
+        with st.spinner("I'm simplifying the text for you..."):
+            best_text_formatted = clean_and_format_text_sync(
+                best_text["text"], on_token=stream_into(text_placeholder)
+            )
+        text_placeholder.empty()
 
         with st.container():
             # st.header("This is the text. Read it carefully, and then answer the question below.")
@@ -245,21 +597,58 @@ def main():
                     .replace("\\", "\\\\")
                 )
         # with st.form("question_form"):
-        with st.status("I'm finding a good question for you, hang on tight!"):
-            st.write(f"Generating a few candidate questions...")
-            frqs = generate_frqs_sync(best_text_formatted)
-
-            st.write(
-                f"I generated {len(frqs)} questions for you. Let me select the best one..."
-            )
+        banked_frqs = get_question_bank().top_frqs(
+            text_key(best_text_formatted, llm.openai.MODEL)
+        )
+        if banked_frqs:
+            best_frq = banked_frqs[0]
+        else:
+            best_frq = None
+            with st.status("I'm finding a good question for you, hang on tight!"):
+                # If none of the questions is eligible, a fresh set is generated once.
+                for fresh in (False, True):
+                    st.write(f"Generating a few candidate questions...")
+                    frqs = uncached_if_degraded(
+                        generate_frqs_sync, best_text_formatted, fresh, _deadline=deadline
+                    )
 
-            # Rank them in parallel
-            start_time = time()
-            frq_rankings = rank_frqs_sync(frqs, best_text_formatted)
-            # frq_rankings = await asyncio.gather(*[assess_frq(frq, text) for frq in frqs])
-            print(f"Assessment time: {time() - start_time}")
+                    st.write(
+                        f"I generated {len(frqs)} questions for you. Let me select the best one..."
+                    )
+                    unique_frqs = deduplicate_frqs(frqs)
+                    if len(unique_frqs) < len(frqs):
+                        st.write(
+                            f"Skipped {len(frqs) - len(unique_frqs)} near-duplicate questions."
+                        )
+
+                    # Rank them in parallel
+                    start_time = time()
+                    frq_rankings = uncached_if_degraded(
+                        rank_frqs_sync,
+                        unique_frqs,
+                        best_text_formatted,
+                        use_cascade,
+                        batched_frq_assessment,
+                        screen_frqs,
+                        _deadline=deadline,
+                    )
+                    # frq_rankings = await asyncio.gather(*[assess_frq(frq, text) for frq in frqs])
+                    print(f"Assessment time: {time() - start_time}")
+
+                    if any(is_eligible_frq(frq_ranking) for frq_ranking in frq_rankings):
+                        best_frq = select_best_frq(frq_rankings)
+                        break
+                    st.write("None of these questions is a good fit, let me try again...")
+            if best_frq is None:
+                st.error(
+                    "Sorry, I couldn't come up with a good question about this text. Please try another topic."
+                )
+                return
 
-            best_frq = select_best_frq(frq_rankings)
+        if "sample_answers" not in st.session_state:
+            st.session_state["sample_answers"] = SampleAnswerPrefetcher()
+        sample_answers = st.session_state["sample_answers"]
+        sample_answers.prefetch(best_frq["frq"], best_text_formatted, llm.openai.MODEL)
 
         st.markdown(f"## {best_frq['frq']}")
 
@@ -331,17 +720,17 @@ def main():
             print("Generating answer")
             with st.spinner("Generating an answer..."):
                 selected = st.session_state["selected"]
-                response_prompt = ""
-                if selected == "good":
-                    response_prompt = "Excellent answer, the best that can possibly be expected from a fourth-grader. All of the relevant information is included, and the answer is well-structured and easy to follow. The answer is also free of grammatical errors and typos."
-                elif selected == "mediocre":
-                    response_prompt = "A mediocre answer. The answer is somewhat relevant, but it is not well-structured and it is hard to follow. There are a few grammatical errors and typos, but the answer is still readable."
-                elif selected == "bad":
-                    response_prompt = "A terrible answer. The answer does not answer the question, and is completely unstructured and full of non-sequiturs. It's also FULL of grammatical errors and typos, badly formatted, and hard to read."
                 print(f"Generating answer with selected: {selected}")
-                generated_answer = answer_question_sync(
-                    best_frq, best_text_formatted, response_prompt
+                generated_answer = sample_answers.take(
+                    best_frq["frq"], best_text_formatted, llm.openai.MODEL, selected
                 )
+                if generated_answer is None:
+                    generated_answer = answer_question_sync(
+                        best_frq,
+                        best_text_formatted,
+                        ANSWER_DESCRIPTIONS[selected],
+                        on_token=stream_into(st.empty()),
+                    )
 
             st.session_state["generated_answer"] = generated_answer
             st.session_state["generating_answer"] = False
@@ -398,37 +787,59 @@ def main():
 
             st.markdown("## Feedback on your answer")
 
+            # One slot per parameter, filled in as soon as its feedback is ready.
+            feedback_placeholders = {
+                parameter: st.empty() for parameter in GRADING_PARAMETERS
+            }
+
+            def show_feedback(feedback_category, feedback):
+                with feedback_placeholders[feedback_category].container():
+                    render_feedback(feedback_category, feedback)
+
+            session = st.session_state.get("feedback_session")
+            if (
+                session is None
+                or session.frq != best_frq
+                or session.text != best_text_formatted
+            ):
+                session = FeedbackSession(best_frq, best_text_formatted)
+                st.session_state["feedback_session"] = session
+
             with st.spinner(
                 "I'm evaluating your answer and generating some feedback for you. Hang on tight!"
             ):
                 # feedbacks = loop.run_until_complete(give_feedback_on_answer(answer, best_frq["frq"], best_text_formatted))
-                feedbacks = give_feedback_sync(answer, best_frq, best_text_formatted)
+                feedback_args = (
+                    answer,
+                    best_frq,
+                    best_text_formatted,
+                    feedback_mode.lower(),
+                    mechanics_mode,
+                )
+                session_digest = session.digest()
+                try:
+                    feedbacks = cached_feedback(*feedback_args, session_digest)
+                except NotCached:
+                    feedback_deadline = deadline.portion(1.0)
+                    feedbacks = give_feedback_sync(
+                        *feedback_args,
+                        deadline=feedback_deadline,
+                        on_parameter=show_feedback,
+                        session=session,
+                    )
+                    if not feedback_deadline.degraded:
+                        cached_feedback(
+                            *feedback_args, session_digest, _feedbacks=feedbacks
+                        )
+                # Cache hits don't go through the session.
+                session.record(answer, feedbacks)
                 print("Done generating feedback")
 
+            # Also covers cached feedbacks, which weren't rendered as they came in.
             for feedback_category, feedback in feedbacks.items():
-                grade = f"{feedback['aggregated_grade']}/5"
-
-                color = (
-                    "green"
-                    if feedback["aggregated_grade"] > 3
-                    else "black"
-                    if feedback["aggregated_grade"] == 3
-                    else "red"
-                )
-                label = f"""## {feedback_category}: :{color}[{grade}]
-{feedback['aggregated_summary']}
-*(click here to view detailed feedback)*
-    """
-
-                with st.expander(label=label, expanded=False):
-                    newline = "\n"
-                    st.write(
-                        f"""
-#### Detailed feedback: 
-{feedback['aggregated_feedback'].replace(newline, '  ' + newline)}
-"""
-                    )
+                show_feedback(feedback_category, feedback)
 
+            rewrite_placeholder = st.empty()
             with st.spinner("Writing a new answer that incorporates the feedback..."):
                 # rewritten_answer= loop.run_until_complete(rewrite_text_according_to_feedback(text=best_text_formatted, question=best_frq["frq"], answer=answer, feedback=feedbacks))
                 rewritten_answer = rewrite_text_according_to_feedback_sync(
@@ -436,7 +847,9 @@ def main():
                     question=best_frq["frq"],
                     answer=answer,
                     feedback=feedbacks,
+                    on_token=stream_into(rewrite_placeholder),
                 )
+            rewrite_placeholder.empty()
 
             st.write("### Good job completing this exercise! \n If you'd like click on the box below to view an example of how you could rewrite your answer to incorporate this feedback. Otherwise, feel free to try answering again to see how you do - or choose a new topic to start over!")
             with st.expander(
@@ -460,4 +873,6 @@ if __name__ == "__main__":
         pass
     finally:
         print("Closing Loop")
+        # Lets the LLM client close its HTTP session on this loop.
+        loop.run_until_complete(loop.shutdown_asyncgens())
         loop.close()
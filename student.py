@@ -1,12 +1,21 @@
 import json
 import time
-from llm import OpenAifunction, OpenaiChatMessage, get_response_openai_nonstream
+from typing import Callable
+
+from llm import (
+    OpenAifunction,
+    OpenaiChatMessage,
+    get_response_openai_nonstream,
+    get_streamed_response,
+)
 
 
 async def answer_question_as_student(
         frq: str,
         text: str, 
-        answer_description: str 
+        answer_description: str,
+        on_token: Callable[[str], None] | None = None,
+        model: str | None = None,
 ): 
     
     prompt = f"""
@@ -41,9 +50,13 @@ Question:
     
     print("Sending to OpenAI")
     start_time = time.time()
-    response = await get_response_openai_nonstream(
-        messages_for_openai,
-    )
+    if on_token is not None:
+        response = await get_streamed_response(messages_for_openai, on_token, model=model)
+    else:
+        response = await get_response_openai_nonstream(
+            messages_for_openai,
+            model=model,
+        )
     print(f"OpenAI response time: {time.time() - start_time}")
     return response
 
@@ -0,0 +1,39 @@
+from prefilter import near_duplicate_clusters
+
+# FRQs in the style of generate_frqs, for the baseball uniform text in frq.py: distinct
+# questions, and rephrasings of some of them. These calibrate NEAR_DUPLICATE_THRESHOLD.
+DISTINCT_FRQS = [
+    "Analyze the evolution of baseball uniforms from the first teams to today. Use evidence from the text to support your answer.",
+    "Why do you think teams started wearing different uniforms at home and away? Use evidence from the text.",
+    "How did the rules about caps and headgear change over time? Support your answer with evidence from the text.",
+    "Compare the uniforms of the New York Knickerbockers in 1849 with modern uniforms. Use evidence from the text.",
+    "What do you think about MLB putting the FTX logo on umpire uniforms? Use details from the text to explain your opinion.",
+    "Why was the 1882 rule about uniform colors for each position abandoned? Use evidence from the text.",
+    "What role do logos, colors and numbers play on a baseball uniform? Use details from the text to explain.",
+    "Why do many teams have alternate or throwback uniforms? Support your answer with evidence from the text.",
+    "Which teams were the first to wear striped uniforms, and why do you think this was important? Use the text.",
+    "How do uniforms help fans and players tell teams apart during a game? Use evidence from the text.",
+]
+REPHRASINGS = {
+    0: "Describe how baseball uniforms changed over time. Use details from the text in your answer.",
+    1: "Explain why baseball teams began to have separate home and away uniforms, using details from the text.",
+    3: "How were the Knickerbockers' uniforms in 1849 different from the uniforms teams wear today? Use the text to explain.",
+}
+
+
+def test_rephrased_question_is_a_near_duplicate():
+    assert near_duplicate_clusters([DISTINCT_FRQS[0], REPHRASINGS[0]]) == [[0, 1]]
+
+
+def test_distinct_questions_are_kept_apart():
+    assert near_duplicate_clusters(DISTINCT_FRQS) == [[i] for i in range(len(DISTINCT_FRQS))]
+
+
+def test_rephrasings_join_their_original_among_other_questions():
+    frqs = DISTINCT_FRQS + list(REPHRASINGS.values())
+    clusters = near_duplicate_clusters(frqs)
+
+    assert len(clusters) == len(DISTINCT_FRQS)
+    for offset, original in enumerate(REPHRASINGS):
+        assert [original, len(DISTINCT_FRQS) + offset] in clusters
+
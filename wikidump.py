@@ -0,0 +1,264 @@
+"""
+Offline Wikipedia backend: a local, compressed dump of plain-text page extracts with a
+memory-mapped title index and a BM25 index for topic search.
+
+A dump directory contains:
+
+- pages.bin: zlib-compressed JSON records {"title", "extract"}, one after the other.
+- titles.idx: fixed-size (title hash, offset, length) entries sorted by hash.
+- docs.npy: (offset, length, BM25 document length) of each page, by document id.
+- terms.npy / terms.bin: the BM25 vocabulary, as (term hash, first posting, number of
+  postings, offset and length of the term in terms.bin) entries sorted by hash.
+- postings.npy: (document id, term frequency) pairs, grouped by term.
+
+Everything is memory-mapped, so opening a dump reads nothing up front and a WikiDump can
+be shared by concurrent threads.
+
+Build one from a JSONL file of {"title", "extract"} objects (e.g. produced with
+WikiExtractor from an official dump, extracts keeping "== Heading ==" lines) with
+
+    python wikidump.py pages.jsonl dump_dir/
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+
+PAGES_FILE = "pages.bin"
+TITLES_FILE = "titles.idx"
+DOCS_FILE = "docs.npy"
+TERMS_FILE = "terms.npy"
+TERM_TEXT_FILE = "terms.bin"
+POSTINGS_FILE = "postings.npy"
+
+# title hash, offset in pages.bin, compressed length
+INDEX_ENTRY = struct.Struct("<QQI")
+TERM_DTYPE = np.dtype(
+    [
+        ("hash", "<u8"),
+        ("start", "<u8"),
+        ("count", "<u4"),
+        ("text_offset", "<u8"),
+        ("text_length", "<u4"),
+    ]
+)
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has he in is it its of on or that the to was were "
+    "will with this which".split()
+)
+# Title terms count this many times in the BM25 document, to favour pages about the topic.
+TITLE_WEIGHT = 3
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> list[str]:
+    return [
+        token
+        for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+def normalize_title(title: str) -> str:
+    return title.strip().replace("_", " ").lower()
+
+
+def stable_hash(text: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+def title_hash(title: str) -> int:
+    return stable_hash(normalize_title(title))
+
+
+def map_file(path: str) -> mmap.mmap | bytes:
+    with open(path, "rb") as f:
+        # mmap can't map empty files.
+        if not os.fstat(f.fileno()).st_size:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def build_dump(pages: Iterable[tuple[str, str]], directory: str) -> None:
+    """
+    Writes a dump directory from (title, extract) pairs.
+
+    Args:
+        pages (Iterable[tuple[str, str]]): Page titles and plain-text extracts.
+        directory (str): Output directory, created if needed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    index_entries = []
+    docs: list[tuple[int, int, int]] = []
+    postings: defaultdict[str, list[tuple[int, int]]] = defaultdict(list)
+
+    with open(os.path.join(directory, PAGES_FILE), "wb") as pages_file:
+        for doc_id, (title, extract) in enumerate(pages):
+            record = zlib.compress(
+                json.dumps({"title": title, "extract": extract}).encode("utf-8")
+            )
+            offset = pages_file.tell()
+            index_entries.append((title_hash(title), offset, len(record)))
+            pages_file.write(record)
+
+            terms = Counter(tokenize(extract))
+            for term in tokenize(title):
+                terms[term] += TITLE_WEIGHT
+            for term, frequency in terms.items():
+                postings[term].append((doc_id, frequency))
+            docs.append((offset, len(record), sum(terms.values())))
+
+    index_entries.sort()
+    with open(os.path.join(directory, TITLES_FILE), "wb") as titles_file:
+        for entry in index_entries:
+            titles_file.write(INDEX_ENTRY.pack(*entry))
+    np.save(
+        os.path.join(directory, DOCS_FILE), np.array(docs, dtype="<u8").reshape(-1, 3)
+    )
+
+    terms = np.zeros(len(postings), dtype=TERM_DTYPE)
+    term_postings = []
+    start = 0
+    with open(os.path.join(directory, TERM_TEXT_FILE), "wb") as term_text_file:
+        for i, (term, doc_postings) in enumerate(postings.items()):
+            encoded = term.encode("utf-8")
+            terms[i] = (
+                stable_hash(term), start, len(doc_postings), term_text_file.tell(), len(encoded)
+            )
+            term_text_file.write(encoded)
+            term_postings.extend(doc_postings)
+            start += len(doc_postings)
+    np.save(os.path.join(directory, TERMS_FILE), np.sort(terms, order="hash"))
+    np.save(
+        os.path.join(directory, POSTINGS_FILE),
+        np.array(term_postings, dtype="<u4").reshape(-1, 2),
+    )
+
+
+class WikiDump:
+    def __init__(self, directory: str):
+        self.directory = directory
+        # Read-only mappings, so concurrent threads don't share a file position.
+        self._pages = map_file(os.path.join(directory, PAGES_FILE))
+        self._index = map_file(os.path.join(directory, TITLES_FILE))
+        self._n_entries = len(self._index) // INDEX_ENTRY.size
+        self._docs = np.load(os.path.join(directory, DOCS_FILE), mmap_mode="r")
+        self._terms = np.load(os.path.join(directory, TERMS_FILE), mmap_mode="r")
+        self._term_text = map_file(os.path.join(directory, TERM_TEXT_FILE))
+        self._postings = np.load(os.path.join(directory, POSTINGS_FILE), mmap_mode="r")
+        self.average_doc_length = (
+            float(self._docs[:, 2].mean()) if len(self._docs) else 0.0
+        )
+
+    def _read_record(self, offset: int, length: int) -> dict:
+        return json.loads(zlib.decompress(self._pages[offset : offset + length]))
+
+    def _find_entries(self, title: str) -> Iterable[tuple[int, int]]:
+        # Binary search over the sorted, fixed-size index entries, for the first entry
+        # with the title's hash.
+        target = title_hash(title)
+        low, high = 0, self._n_entries
+        while low < high:
+            middle = (low + high) // 2
+            entry_hash, _, _ = INDEX_ENTRY.unpack_from(self._index, middle * INDEX_ENTRY.size)
+            if entry_hash < target:
+                low = middle + 1
+            else:
+                high = middle
+        # Different titles can share a hash.
+        for i in range(low, self._n_entries):
+            entry_hash, offset, length = INDEX_ENTRY.unpack_from(
+                self._index, i * INDEX_ENTRY.size
+            )
+            if entry_hash != target:
+                break
+            yield offset, length
+
+    def page(self, title: str) -> tuple[str, str] | None:
+        """Returns the (title, extract) of the page with the given title, if any."""
+        for offset, length in self._find_entries(title):
+            record = self._read_record(offset, length)
+            if normalize_title(record["title"]) == normalize_title(title):
+                return record["title"], record["extract"]
+        return None
+
+    def _term_postings(self, term: str) -> np.ndarray | None:
+        target = stable_hash(term)
+        hashes = self._terms["hash"]
+        low = int(np.searchsorted(hashes, target, side="left"))
+        high = int(np.searchsorted(hashes, target, side="right"))
+        encoded = term.encode("utf-8")
+        for entry in self._terms[low:high]:
+            text_offset, text_length = int(entry["text_offset"]), int(entry["text_length"])
+            if self._term_text[text_offset : text_offset + text_length] == encoded:
+                start, count = int(entry["start"]), int(entry["count"])
+                return self._postings[start : start + count]
+        return None
+
+    def search(self, query: str, limit: int = 5) -> list[str]:
+        """Returns the titles of the `limit` pages that best match `query` (BM25)."""
+        n_docs = len(self._docs)
+        doc_ids, scores = [], []
+        for term in set(tokenize(query)):
+            term_postings = self._term_postings(term)
+            if term_postings is None or not len(term_postings):
+                continue
+            idf = np.log(
+                1 + (n_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5)
+            )
+            term_doc_ids = term_postings[:, 0].astype(np.int64)
+            frequencies = term_postings[:, 1].astype(np.float64)
+            length_norm = 1 - BM25_B + BM25_B * (
+                self._docs[term_doc_ids, 2] / self.average_doc_length
+            )
+            doc_ids.append(term_doc_ids)
+            scores.append(
+                idf * frequencies * (BM25_K1 + 1) / (frequencies + BM25_K1 * length_norm)
+            )
+        if not doc_ids:
+            return []
+        matched, inverse = np.unique(np.concatenate(doc_ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        best = matched[np.argsort(-totals, kind="stable")[:limit]]
+        return [
+            self._read_record(int(self._docs[doc_id, 0]), int(self._docs[doc_id, 1]))["title"]
+            for doc_id in best
+        ]
+
+    def close(self) -> None:
+        for mapping in [self._pages, self._index, self._term_text]:
+            if isinstance(mapping, mmap.mmap):
+                mapping.close()
+
+
+@lru_cache(maxsize=None)
+def open_dump(directory: str) -> WikiDump:
+    return WikiDump(directory)
+
+
+if __name__ == "__main__":
+    import sys
+
+    source, directory = sys.argv[1], sys.argv[2]
+
+    def read_pages():
+        with open(source) as f:
+            for line in f:
+                if line.strip():
+                    page = json.loads(line)
+                    yield page["title"], page["extract"]
+
+    build_dump(read_pages(), directory)
+    print(f"Wrote dump to {directory}")
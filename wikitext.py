@@ -1,71 +1,193 @@
+import asyncio
 import json
+import math
+import os
+import re
 import time
+from dataclasses import dataclass, field
+from typing import Callable, NamedTuple
+
 import aiohttp
 
-import wikipediaapi 
-import wikipedia as wpsearch # Older library that supports search but borks other stuff
-from llm import get_response_openai_nonstream, OpenAifunction, OpenaiChatMessage
+from deadline import NO_DEADLINE, Deadline, gather_within
+from ranking import RankingPolicy, top_k, weighted_score
+from wikidump import open_dump
+from llm import (
+    STAGE_CASCADES,
+    CascadeConfig,
+    OpenAifunction,
+    OpenaiChatMessage,
+    get_response_openai_nonstream,
+    get_streamed_response,
+)
     
 
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/api.php"
+WIKIPEDIA_HEADERS = {"User-Agent": "OpenAI Wikipedia/0.1"}
+# When set, pages come from this local dump (see wikidump.py) instead of live Wikipedia.
+WIKIPEDIA_DUMP_PATH = os.environ.get("WIKIPEDIA_DUMP_PATH", "")
+# Plain-text extracts mark headings as "== Title ==", with one "=" more per level.
+HEADING_PATTERN = re.compile(r"^(={2,6})\s*(.+?)\s*\1\s*$", re.MULTILINE)
 
-wiki = wikipediaapi.Wikipedia(
- user_agent="OpenAI Wikipedia/0.1",
-language="en",
-)
+
+@dataclass
+class WikiSection:
+    title: str
+    level: int
+    # Text directly under this heading, excluding subsections.
+    text: str = ""
+    sections: list["WikiSection"] = field(default_factory=list)
+
+
+@dataclass
+class WikiPage:
+    title: str
+    # Lead section, before the first heading.
+    text: str = ""
+    sections: list[WikiSection] = field(default_factory=list)
+
+
+def parse_extract(title: str, extract: str) -> WikiPage:
+    """
+    Builds the section tree of a page from its plain-text extract.
+
+    Args:
+        title (str): Title of the page.
+        extract (str): Plain-text extract with wiki-formatted section headings.
+
+    Returns:
+        WikiPage: The page with its nested sections.
+    """
+    headings = list(HEADING_PATTERN.finditer(extract))
+    page = WikiPage(
+        title=title, text=extract[: headings[0].start() if headings else None].strip()
+    )
+    # Stack of (level, children list) for the sections currently open.
+    open_sections: list[tuple[int, list[WikiSection]]] = [(1, page.sections)]
+    for heading, next_heading in zip(headings, headings[1:] + [None]):
+        level = len(heading.group(1))
+        section = WikiSection(
+            title=heading.group(2),
+            level=level,
+            text=extract[heading.end() : next_heading.start() if next_heading else None].strip(),
+        )
+        while open_sections[-1][0] >= level:
+            open_sections.pop()
+        open_sections[-1][1].append(section)
+        open_sections.append((level, section.sections))
+    return page
+
+
+async def query_wikipedia(session: aiohttp.ClientSession, **params) -> dict:
+    async with session.get(
+        WIKIPEDIA_API_URL,
+        params={"action": "query", "format": "json", "formatversion": "2", **params},
+        headers=WIKIPEDIA_HEADERS,
+    ) as response:
+        response.raise_for_status()
+        return await response.json()
+
+
+async def fetch_page(session: aiohttp.ClientSession, title: str) -> WikiPage | None:
+    result = await query_wikipedia(
+        session,
+        prop="extracts",
+        explaintext="1",
+        exsectionformat="wiki",
+        redirects="1",
+        titles=title,
+    )
+    pages = result.get("query", {}).get("pages", [])
+    if not pages or pages[0].get("missing") or not pages[0].get("extract"):
+        return None
+    return parse_extract(pages[0]["title"], pages[0]["extract"])
 
 
 async def fetch_relevant_wikipedia_pages(
     topic: str, session: aiohttp.ClientSession
-) -> list[wikipediaapi.WikipediaPage]:
+) -> list[WikiPage]:
     """
-    Fetches the Wikipedia page for the given topic.
+    Fetches the Wikipedia pages most relevant to the given topic.
 
     Args:
         topic (str): Topic of interest.
         session (aiohttp.ClientSession): The aiohttp client session for making requests.
 
     Returns:
-        wikipediaapi.WikipediaPage: The Wikipedia page.
+        list[WikiPage]: The Wikipedia pages, most relevant first.
     """
 
-    candidates = wpsearch.search(topic, results = 5)
-    pages: list[wikipediaapi.WikipediaPage] = []
-    for candidate in candidates:
-        page = wiki.page(candidate)
-        if not page.exists():
-            continue
-        pages.append(page)
+    if WIKIPEDIA_DUMP_PATH:
+        return fetch_relevant_dump_pages(topic, WIKIPEDIA_DUMP_PATH)
 
+    search = await query_wikipedia(
+        session, list="search", srsearch=topic, srlimit="5", srprop=""
+    )
+    candidates = [result["title"] for result in search.get("query", {}).get("search", [])]
+
+    # Full-page extracts can't be batched into one query (the API only returns several
+    # extracts at once for intros), so fetch them concurrently instead.
+    pages = await asyncio.gather(
+        *[fetch_page(session, candidate) for candidate in candidates]
+    )
+    return [page for page in pages if page is not None]
+
+
+def fetch_relevant_dump_pages(topic: str, dump_path: str) -> list[WikiPage]:
+    """
+    Offline counterpart of fetch_relevant_wikipedia_pages, backed by a local dump.
+
+    Args:
+        topic (str): Topic of interest.
+        dump_path (str): Directory of a dump built with wikidump.build_dump.
+
+    Returns:
+        list[WikiPage]: The pages, most relevant first.
+    """
+    dump = open_dump(dump_path)
+    pages = []
+    for candidate in dump.search(topic, limit=5):
+        page = dump.page(candidate)
+        if page is not None:
+            pages.append(parse_extract(*page))
     return pages
 
 
 def extract_sections(
-    page: wikipediaapi.WikipediaPage| wikipediaapi.WikipediaPageSection, min_words: int = 250, max_wrds: int = 1000
-) -> list[tuple[str, str]]:
+    page: WikiPage | WikiSection,
+    min_words: int = 250,
+    max_wrds: int = 1000,
+    page_title: str | None = None,
+) -> list[tuple[str, str, str]]:
     """
     Extracts sections from the Wikipedia page that are at least min_length words long.
 
     Args:
-        page (wikipediaapi.WikipediaPage): The Wikipedia page.
+        page (WikiPage): The Wikipedia page.
         min_length (int, optional): Minimum number of words in a section. Defaults to 400.
+        page_title (str, optional): Title of the page the sections belong to. Defaults
+            to the title of `page`.
 
     Returns:
-        List[str]: A list of extracted sections from the page.
+        list[tuple[str, str, str]]: (text, section title, page title) of each extracted
+            section.
     """
+    if page_title is None:
+        page_title = page.title
 
-    results: list[tuple[str,str]] = []
+    results: list[tuple[str, str, str]] = []
     for section in page.sections:
         if len(section.text.split()) > min_words and len(section.text.split()) < max_wrds:
-            results.append((section.text, section.title))
+            results.append((section.text, section.title, page_title))
 
         for subsection in section.sections:
-            results += extract_sections(subsection, min_words, max_wrds)
+            results += extract_sections(subsection, min_words, max_wrds, page_title)
         
 
     return results
         
 
-async def rank_section(section: str, title: str,   topic: str) -> dict:
+async def rank_section(section: str, title: str,   topic: str, model: str | None = None) -> dict:
 
     system_prompt = """
     You are an educational expert who is currently evaluating texts to be used for assessing student skills on the CCSS.ELA-Literacy.W.4 common core standard. The standard is: 
@@ -169,7 +291,11 @@ TEXT:
     print("Sending to OpenAI")
     start_time = time.time()
     arguments = await get_response_openai_nonstream(
-        messages_for_openai, functions=[add_assessment_openai_function], function_name="add_assessment"
+        messages_for_openai,
+        functions=[add_assessment_openai_function],
+        function_name="add_assessment",
+        call_site="rank_section",
+        model=model,
     )
     print(f"OpenAI response time: {time.time() - start_time}")
     # arguments = json.loads(response["arguments"])
@@ -179,29 +305,160 @@ TEXT:
     return arguments
 
 
-def select_best_text(text_rankings: list[dict]) -> dict:
-    
-    # Start by removing any text for which age-appropriateness is below 3
-    text_rankings = [text for text in text_rankings if text["age_appropriateness_score"] > 3]
+# Texts need an age-appropriateness score above this to be selected.
+AGE_APPROPRIATENESS_CUTOFF = 3
 
 
-    # Compute average score for each text
-    for text in text_rankings:
-        text["average_score"] = (
-            text["relevance_score"]
-            + text["age_appropriateness_score"]
-            + text["complexity_fit_score"]
-            + text["potential_for_assessment_score"]
-            + text["overall_educational_value_score"]
-        ) / 5
+TEXT_RANKING_POLICY = RankingPolicy(
+    weights={
+        "relevance_score": 1,
+        "age_appropriateness_score": 1,
+        "complexity_fit_score": 1,
+        "potential_for_assessment_score": 1,
+        "overall_educational_value_score": 1,
+    },
+    filters={"age_appropriateness_score": (">", AGE_APPROPRIATENESS_CUTOFF)},
+)
 
-    # Sort by average score
-    text_rankings.sort(key=lambda x: x["average_score"], reverse=True)
 
-    # Return the top text
-    return text_rankings[0]
+def is_eligible_text(text_ranking: dict) -> bool:
+    return text_ranking["age_appropriateness_score"] > AGE_APPROPRIATENESS_CUTOFF
 
-async def clean_and_format_text(text: str) -> str:
+
+def average_text_score(text_ranking: dict) -> float:
+    return weighted_score(text_ranking, TEXT_RANKING_POLICY)
+
+
+def select_best_text(
+    text_rankings: list[dict], policy: RankingPolicy = TEXT_RANKING_POLICY
+) -> dict:
+    """
+    Returns (a copy of) the best age-appropriate text ranking, with its "average_score".
+    """
+    return top_k(text_rankings, policy, k=1, score_key="average_score")[0]
+
+
+async def rank_sections_cascade(
+    sections: list[tuple[str, str, str]],
+    topic: str,
+    config: CascadeConfig = STAGE_CASCADES["rank_section"],
+    deadline: Deadline = NO_DEADLINE,
+) -> list[dict]:
+    """
+    Scores all sections with the cheap model and re-scores only the promising or
+    borderline ones with the expensive model.
+
+    Args:
+        sections (list[tuple[str, str, str]]): As returned by extract_sections.
+        topic (str): Topic of interest.
+        config (CascadeConfig): Which models handle which tier.
+        deadline (Deadline): When to settle for the rankings already in, in each tier.
+
+    Returns:
+        list[dict]: The expensive model's rankings of the escalated sections. Cheap-model
+            scores aren't comparable with them, so the others are left out.
+    """
+    # Keep part of the budget for the expensive tier.
+    rankings = await gather_within(
+        [
+            rank_section(text, title, topic, model=config.cheap_model)
+            for text, title, _ in sections
+        ],
+        deadline.portion(0.5),
+        min_results=config.top_k,
+        usable=is_eligible_text,
+    )
+
+    by_score = sorted(rankings, key=average_text_score, reverse=True)
+    eligible = [ranking for ranking in by_score if is_eligible_text(ranking)]
+    # The best candidates, plus strong candidates the cheap model may have wrongly
+    # filtered in or out.
+    to_escalate = eligible[: config.top_k] + [
+        ranking
+        for ranking in by_score[: config.top_k]
+        if ranking not in eligible[: config.top_k]
+        and abs(ranking["age_appropriateness_score"] - AGE_APPROPRIATENESS_CUTOFF)
+        <= config.threshold_margin
+    ]
+    escalated: list[dict] = []
+    tried: set[str] = set()
+    for round_number in range(config.max_rounds):
+        if not to_escalate:
+            break
+        # The first round always runs: without it no ranking is comparable. Later ones
+        # only while there is time left.
+        if round_number > 0 and deadline.expired():
+            deadline.mark_degraded()
+            break
+        print(f"Escalating {len(to_escalate)}/{len(rankings)} sections to {config.expensive_model}")
+        escalated += await gather_within(
+            [
+                rank_section(ranking["text"], ranking["title"], topic, model=config.expensive_model)
+                for ranking in to_escalate
+            ],
+            deadline,
+            usable=is_eligible_text,
+        )
+        if any(is_eligible_text(ranking) for ranking in escalated):
+            break
+        # The expensive model filtered out every candidate so far: try the next ones.
+        tried |= {ranking["text"] for ranking in to_escalate}
+        to_escalate = [ranking for ranking in by_score if ranking["text"] not in tried][
+            : config.top_k
+        ]
+    return escalated
+
+class EarlyStopConfig(NamedTuple):
+    # A text this good (and age-appropriate) is selected as soon as it comes in.
+    good_enough_score: float = 4.5
+    # Once this share of the rankings is in, the best eligible one so far is selected.
+    quorum: float = 0.5
+
+
+async def rank_sections_until_good_enough(
+    sections: list[tuple[str, str, str]],
+    topic: str,
+    config: EarlyStopConfig = EarlyStopConfig(),
+    deadline: Deadline = NO_DEADLINE,
+) -> list[dict]:
+    """
+    Ranks sections concurrently but stops waiting as soon as a good enough text, or a
+    quorum of rankings with at least one eligible text, has arrived. Rankings still in
+    flight are cancelled.
+
+    Args:
+        sections (list[tuple[str, str, str]]): As returned by extract_sections.
+        topic (str): Topic of interest.
+        config (EarlyStopConfig): When to stop waiting.
+        deadline (Deadline): When to settle for the rankings already in, once there is
+            an eligible one.
+
+    Returns:
+        list[dict]: The rankings that completed, to be passed to select_best_text.
+    """
+    quorum = max(1, math.ceil(config.quorum * len(sections)))
+
+    def good_enough(rankings: list[dict]) -> bool:
+        if any(
+            is_eligible_text(ranking) and average_text_score(ranking) >= config.good_enough_score
+            for ranking in rankings
+        ):
+            print(f"Found a good enough text after {len(rankings)}/{len(sections)} rankings")
+            return True
+        if len(rankings) >= quorum and any(is_eligible_text(ranking) for ranking in rankings):
+            print(f"Reached quorum after {len(rankings)}/{len(sections)} rankings")
+            return True
+        return False
+
+    return await gather_within(
+        [rank_section(text, title, topic) for text, title, _ in sections],
+        deadline,
+        usable=is_eligible_text,
+        until=good_enough,
+    )
+
+
+async def clean_and_format_text(text: str, on_token: Callable[[str], None] | None = None) -> str:
     # prompt = f"""
     # You are tasked with cleaning up texts so that they are easily readable and well formatted. Given a text, you do the following tasks:
 
@@ -238,15 +495,17 @@ You also fix the text formatting by removing references, fixing spacing issues,
         ),
     ]
 
-    formatted_text = await get_response_openai_nonstream(
-        messages_for_openai,
-    )
+    if on_token is not None:
+        formatted_text = await get_streamed_response(messages_for_openai, on_token)
+    else:
+        formatted_text = await get_response_openai_nonstream(
+            messages_for_openai,
+        )
 
     print(f"Original text: \n\n {text} \n\n Formatted text: \n\n {formatted_text}")
     return formatted_text
 
 if __name__ == "__main__":
-    import asyncio
 
     async def main():
         async with aiohttp.ClientSession() as session: